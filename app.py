@@ -6,36 +6,98 @@ Conversational AI with OAuth authentication and chat history.
 from dotenv import load_dotenv
 load_dotenv()  # Load env vars FIRST
 
+from logging_config import setup_logging, RequestContextMiddleware
+setup_logging()  # before other imports so their import-time warnings are captured
+
 import os
+import logging
 import base64
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, WebSocket, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse, FileResponse
+from fastapi.responses import RedirectResponse, StreamingResponse, JSONResponse
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 
-from database import init_db, get_db, User, Conversation, Message
+from database import init_db, get_db, SessionLocal, User, Conversation, Message
 from models import (
     MessageRequest, MessageResponse, ChatResponse,
     ConversationResponse, ConversationListItem,
+    SearchResult, SearchResponse, ImportResponse, UsageReportRow,
     UserResponse, TokenResponse, GraphRequest
 )
 from auth import (
-    get_current_user, create_jwt_token,
+    get_current_user, get_admin_user, create_jwt_token,
     get_google_auth_url,
     exchange_google_code,
     get_or_create_user, FRONTEND_URL
 )
-from chat_engine import ChatEngine
+from chat_engine import ChatEngine, PendingGraph
+from firebase_utils import init_firebase, firebase_status
+from graph_storage import get_graph_storage, is_valid_key, media_type
+from ws_chat import ChatSocketSession
+from search import search_conversations
+from usage import track_usage, save_usage, usage_report
+from idempotency import run_idempotent, request_fingerprint
+from deadline import DEADLINE_HEADER, DEFAULT_DEADLINE_SECONDS, parse_deadline, request_deadline, deadline_exceeded
+from responses import (
+    FastJSONResponse, CompressionMiddleware,
+    make_etag, validator_headers, is_not_modified, not_modified_response
+)
+from retention import RetentionPolicy, retention_loop, purge_conversations
+from chat_transfer import (
+    iter_export_lines, ConversationImporter,
+    ImportRecordError, MAX_LINE_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+# Set during startup; reported by /health/ready
+startup_state = {"database": False, "warm_up": False}
+
+
+async def warm_up():
+    """Initialize optional heavy subsystems in parallel after the server is accepting requests."""
+    tasks = [asyncio.to_thread(init_firebase)]
+    if chat_engine:
+        tasks.append(asyncio.to_thread(lambda: chat_engine.solver.client))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning("Warm-up failed: %s", result)
+    # Done, successful or not: a failed component shows in /health/ready but doesn't hold it
+    startup_state["warm_up"] = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup (database, warm-up) and background jobs for the app's lifetime."""
+    # Only the database is needed before serving; everything else warms in the background
+    await asyncio.to_thread(init_db)
+    startup_state["database"] = True
+    warm_task = asyncio.create_task(warm_up())
+    
+    retention_task = None
+    policy = RetentionPolicy.from_env()
+    if policy.enabled:
+        retention_task = asyncio.create_task(retention_loop(policy))
+    
+    yield
+    
+    warm_task.cancel()
+    if retention_task:
+        retention_task.cancel()
 
-# Initialize database
-init_db()
 
 # Initialize FastAPI
 app = FastAPI(
     title="JEE/Olympiad Math Agent API",
     description="Conversational AI math tutor with authentication",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS for frontend
@@ -47,15 +109,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated brotli/gzip for large payloads (conversations carry KBs of LaTeX)
+app.add_middleware(CompressionMiddleware)
+
+# Added last = outermost: request IDs and access timing cover everything below
+app.add_middleware(RequestContextMiddleware)
+
 # Initialize chat engine
 API_KEY = os.getenv("GROQ_API_KEY")
 if not API_KEY:
-    print("WARNING: GROQ_API_KEY not found in environment variables. Chat features will fail.")
+    logger.warning("GROQ_API_KEY not found in environment variables. Chat features will fail.")
 
 try:
-    chat_engine = ChatEngine(api_key=API_KEY)
+    chat_engine = ChatEngine(
+        api_key=API_KEY,
+        speculative_graphs=os.getenv("SPECULATIVE_GRAPHS", "").lower() in ("1", "true", "yes"),
+        graph_repair=os.getenv("GRAPH_REPAIR_RETRY", "true").lower() in ("1", "true", "yes"),
+        solution_cache=os.getenv("SOLUTION_CACHE", "true").lower() in ("1", "true", "yes")
+    )
 except Exception as e:
-    print(f"Error initializing ChatEngine: {e}")
+    logger.error("Error initializing ChatEngine: %s", e)
     chat_engine = None
 
 
@@ -74,10 +147,33 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check for deployment."""
+    """Liveness check: the process is up and serving."""
     return {"status": "healthy"}
 
 
+@app.get("/health/ready")
+async def readiness():
+    """
+    Readiness check: 503 while warm-up (LLM client, Firebase) is still running after
+    startup, so traffic isn't routed to a cold instance; reports each component.
+    """
+    if not chat_engine:
+        llm = "disabled"
+    else:
+        llm = "ready" if chat_engine.solver.is_warm else "cold"
+    
+    components = {
+        "database": "ready" if startup_state["database"] else "cold",
+        "llm": llm,
+        "firebase": firebase_status()
+    }
+    ready = startup_state["database"] and startup_state["warm_up"]
+    return JSONResponse(
+        {"status": "ready" if ready else "starting", "components": components},
+        status_code=200 if ready else 503
+    )
+
+
 # ============== Auth Routes ==============
 
 @app.get("/auth/google")
@@ -113,28 +209,36 @@ async def get_me(user: User = Depends(get_current_user)):
 
 # ============== Chat Routes ==============
 
-@app.post("/chat", response_model=ChatResponse)
-async def send_message(
-    request: MessageRequest,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Send a message and get AI response."""
-    
+def run_chat_turn(
+    db: Session,
+    user_id: int,
+    content: str,
+    conversation_id: int | None = None,
+    on_token=None,
+    deadline_seconds: float = DEFAULT_DEADLINE_SECONDS,
+    on_graph=None
+) -> ChatResponse:
+    """
+    One chat turn: resolve/create the conversation, persist both messages
+    and return the response. Shared by POST /chat and the WebSocket.
+    A graph that can't finish within the deadline is returned as pending and
+    attached to the assistant message when it's done; on_graph(conversation_id,
+    message_id, graph_path, graph_base64) is then called (graph_path None if it failed).
+    """
     # Get or create conversation
     conversation = None
-    if request.conversation_id:
+    if conversation_id:
         conversation = db.query(Conversation).filter(
-            Conversation.id == request.conversation_id,
-            Conversation.user_id == user.id
+            Conversation.id == conversation_id,
+            Conversation.user_id == user_id
         ).first()
         if not conversation:
             raise HTTPException(status_code=404, detail="Conversation not found")
     
     if not conversation:
         conversation = Conversation(
-            user_id=user.id,
-            title=chat_engine.generate_title(request.content)
+            user_id=user_id,
+            title=chat_engine.generate_title(content)
         )
         db.add(conversation)
         db.commit()
@@ -144,17 +248,23 @@ async def send_message(
     user_msg = Message(
         conversation_id=conversation.id,
         role="user",
-        content=request.content
+        content=content
     )
     db.add(user_msg)
     db.commit()
     
-    # Get AI response
-    response_text, offer_graph, graph_url = chat_engine.chat(
-        request.content,
-        conversation,
-        db
-    )
+    # Get AI response, collecting token/latency records for each upstream call
+    with track_usage() as usage, request_deadline(deadline_seconds):
+        response_text, offer_graph, graph_url = chat_engine.chat(
+            content,
+            conversation,
+            db,
+            on_token=on_token
+        )
+    
+    pending_graph = None
+    if isinstance(graph_url, PendingGraph):
+        pending_graph, graph_url = graph_url, None
     
     # Save assistant message
     assistant_msg = Message(
@@ -162,31 +272,38 @@ async def send_message(
         role="assistant",
         content=response_text,
         has_graph=graph_url is not None,
-        graph_path=graph_url  # Now stores Firebase URL or local path
+        graph_path=graph_url,  # Now stores Firebase URL or local path
+        graph_pending=pending_graph is not None
     )
     db.add(assistant_msg)
+    db.flush()
+    save_usage(db, usage.records, user_id, conversation.id, assistant_msg.id)
     
     # Update conversation timestamp
     conversation.updated_at = datetime.utcnow()
     db.commit()
     db.refresh(assistant_msg)
     
-    # For Firebase URLs, no need for base64
-    # For local paths, convert to base64
-    graph_base64 = None
-    if graph_url and not graph_url.startswith('http'):
-        local_path = graph_url.replace('/graph/', 'outputs/')
-        if os.path.exists(local_path):
-            with open(local_path, "rb") as f:
-                graph_base64 = base64.b64encode(f.read()).decode("utf-8")
+    if pending_graph:
+        message_id = assistant_msg.id
+        
+        def finish(path, records):
+            attach_pending_graph(user_id, conversation.id, message_id, path, records)
+            if on_graph:
+                on_graph(conversation.id, message_id, path, inline_graph(path))
+        
+        pending_graph.on_done(finish)
+    
+    graph_base64 = inline_graph(graph_url)
     
     return ChatResponse(
         message=MessageResponse(
             id=assistant_msg.id,
             role=assistant_msg.role,
-            content=assistant_msg.content,
+            content=response_text,
             has_graph=assistant_msg.has_graph,
             graph_path=assistant_msg.graph_path,
+            graph_pending=assistant_msg.graph_pending,
             created_at=assistant_msg.created_at
         ),
         conversation_id=conversation.id,
@@ -195,59 +312,249 @@ async def send_message(
     )
 
 
+def inline_graph(graph_path: str | None) -> str | None:
+    """Base64 of a stored graph; None for Firebase URLs (the client loads those)."""
+    if not graph_path or graph_path.startswith('http'):
+        return None
+    data = get_graph_storage().read_bytes(graph_path)
+    return base64.b64encode(data).decode("utf-8") if data else None
+
+
+def attach_pending_graph(
+    user_id: int,
+    conversation_id: int,
+    message_id: int,
+    graph_path: str | None,
+    records: list[dict]
+):
+    """Store a graph that finished after its response was sent (runs on the graph pool)."""
+    db = SessionLocal()
+    try:
+        db.query(Message).filter(Message.id == message_id).update({
+            Message.has_graph: graph_path is not None,
+            Message.graph_path: graph_path,
+            Message.graph_pending: False
+        })
+        # Bumps the conversation's ETag so polling clients refetch
+        db.query(Conversation).filter(Conversation.id == conversation_id).update({
+            Conversation.updated_at: datetime.utcnow()
+        })
+        save_usage(db, records, user_id, conversation_id, message_id)
+        db.commit()
+    except Exception:
+        logger.exception("Failed to attach graph to message %s", message_id)
+    finally:
+        db.close()
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def send_message(
+    request: MessageRequest,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    deadline: str | None = Header(None, alias=DEADLINE_HEADER),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Send a message and get AI response.
+    With an Idempotency-Key header, retries of the same request replay the
+    first response instead of creating new messages and LLM calls.
+    X-Request-Deadline (seconds) bounds the turn; a late graph comes back as pending.
+    """
+    def turn():
+        return run_chat_turn(
+            db, user.id, request.content, request.conversation_id,
+            deadline_seconds=parse_deadline(deadline)
+        )
+    
+    if not idempotency_key:
+        return await run_in_threadpool(turn)
+    return await run_idempotent(
+        db, user.id, "POST /chat", idempotency_key,
+        request_fingerprint(request.content, request.conversation_id),
+        turn
+    )
+
+
+def list_conversations(db: Session, user_id: int) -> list[dict]:
+    """Conversation list for a user, newest first (one query, counts done in SQL)."""
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(
+            Conversation.id, Conversation.title, Conversation.updated_at,
+            message_count.label("message_count")
+        ).where(
+            Conversation.user_id == user_id
+        ).order_by(Conversation.updated_at.desc())
+    ).mappings().all()
+    
+    return [dict(row) for row in rows]
+
+
 @app.get("/chat/history", response_model=list[ConversationListItem])
 async def get_chat_history(
+    request: Request,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all conversations for current user."""
-    conversations = db.query(Conversation).filter(
-        Conversation.user_id == user.id
-    ).order_by(Conversation.updated_at.desc()).all()
-    
-    return [
-        ConversationListItem(
-            id=c.id,
-            title=c.title,
-            updated_at=c.updated_at,
-            message_count=len(c.messages)
+    """Get all conversations for current user (supports If-None-Match)."""
+    # Version markers from indexed aggregates; no rows are loaded for a 304
+    message_total = (
+        select(func.count(Message.id))
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.user_id == user.id)
+        .scalar_subquery()
+    )
+    version = db.execute(
+        select(
+            func.count(Conversation.id),
+            func.max(Conversation.id),
+            func.max(Conversation.updated_at),
+            message_total
+        ).where(Conversation.user_id == user.id)
+    ).one()
+    
+    # No Last-Modified here: deleting a conversation doesn't advance any timestamp
+    headers = validator_headers(make_etag("history", user.id, *version))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified_response(headers)
+    
+    return FastJSONResponse(list_conversations(db, user.id), headers=headers)
+
+
+@app.get("/chat/search", response_model=SearchResponse)
+async def search_chat_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Full-text search over the current user's messages and conversation titles."""
+    # Fetch one extra row to know whether another page exists
+    hits = search_conversations(db, user.id, q, limit=limit + 1, offset=offset)
+    
+    return SearchResponse(
+        query=q,
+        results=[SearchResult(**hit) for hit in hits[:limit]],
+        limit=limit,
+        offset=offset,
+        has_more=len(hits) > limit
+    )
+
+
+@app.get("/chat/export")
+async def export_conversations(user: User = Depends(get_current_user)):
+    """Stream all of the user's conversations and messages as NDJSON."""
+    return StreamingResponse(
+        iter_export_lines(user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'}
+    )
+
+
+@app.post("/chat/import", response_model=ImportResponse)
+async def import_conversations(
+    request: Request,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Bulk-import conversations from an NDJSON body (same format as /chat/export)."""
+    importer = ConversationImporter(db, user.id)
+    buffer = b""
+    
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            if lines:
+                await run_in_threadpool(importer.add_lines, lines)
+            if len(buffer) > MAX_LINE_BYTES:
+                raise ImportRecordError(importer.line_no + 1, "line too long")
+        
+        await run_in_threadpool(importer.add_lines, [buffer])
+        await run_in_threadpool(importer.flush)
+    except ImportRecordError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{e} ({importer.conversation_count} conversations and "
+                   f"{importer.message_count} messages were imported before the error)"
         )
-        for c in conversations
-    ]
+    
+    return ImportResponse(
+        conversations=importer.conversation_count,
+        messages=importer.message_count
+    )
 
 
 @app.get("/chat/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: int,
+    request: Request,
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get a specific conversation with all messages."""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == user.id
-    ).first()
+    """Get a specific conversation with all messages (supports conditional GET)."""
+    message_count = (
+        select(func.count(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    last_message_id = (
+        select(func.max(Message.id))
+        .where(Message.conversation_id == Conversation.id)
+        .correlate(Conversation)
+        .scalar_subquery()
+    )
+    # Project only the returned columns and serialize trusted rows directly
+    row = db.execute(
+        select(
+            Conversation.id, Conversation.title,
+            Conversation.created_at, Conversation.updated_at,
+            message_count.label("message_count"),
+            last_message_id.label("last_message_id")
+        ).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == user.id
+        )
+    ).mappings().first()
     
-    if not conversation:
+    if not row:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    return ConversationResponse(
-        id=conversation.id,
-        title=conversation.title,
-        created_at=conversation.created_at,
-        updated_at=conversation.updated_at,
-        messages=[
-            MessageResponse(
-                id=m.id,
-                role=m.role,
-                content=m.content,
-                has_graph=m.has_graph,
-                graph_path=m.graph_path,
-                created_at=m.created_at
-            )
-            for m in conversation.messages
-        ]
+    headers = validator_headers(
+        make_etag(
+            "conversation", row["id"], row["updated_at"],
+            row["message_count"], row["last_message_id"]
+        ),
+        last_modified=row["updated_at"]
     )
+    if is_not_modified(request, headers["ETag"], row["updated_at"]):
+        return not_modified_response(headers)
+    
+    conversation = {
+        key: row[key] for key in ("id", "title", "created_at", "updated_at")
+    }
+    
+    messages = db.execute(
+        select(
+            Message.id, Message.role, Message.content,
+            Message.has_graph, Message.graph_path, Message.graph_pending, Message.created_at
+        ).where(
+            Message.conversation_id == conversation_id
+        ).order_by(Message.created_at)
+    ).mappings().all()
+    
+    return FastJSONResponse({
+        **conversation,
+        "messages": [dict(m) for m in messages]
+    }, headers=headers)
 
 
 @app.delete("/chat/{conversation_id}")
@@ -265,10 +572,8 @@ async def delete_conversation(
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Delete all messages first
-    db.query(Message).filter(Message.conversation_id == conversation_id).delete()
-    db.delete(conversation)
-    db.commit()
+    # Bulk-deletes messages, the conversation and its graph files
+    purge_conversations(db, [conversation.id])
     
     return {"message": "Conversation deleted"}
 
@@ -276,37 +581,62 @@ async def delete_conversation(
 @app.post("/chat/{conversation_id}/graph")
 async def generate_graph_for_conversation(
     conversation_id: int,
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+    deadline: str | None = Header(None, alias=DEADLINE_HEADER),
     user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Generate a graph for the last problem in a conversation."""
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == user.id
+    """Generate a graph for the last problem in a conversation (honors Idempotency-Key)."""
+    def generate():
+        with request_deadline(parse_deadline(deadline)):
+            return create_conversation_graph(db, user.id, conversation_id)
+    
+    if not idempotency_key:
+        return await run_in_threadpool(generate)
+    return await run_idempotent(
+        db, user.id, "POST /chat/{id}/graph", idempotency_key,
+        request_fingerprint(conversation_id),
+        generate
+    )
+
+
+def create_conversation_graph(db: Session, user_id: int, conversation_id: int) -> dict:
+    """Render a graph for the conversation's last user message."""
+    conversation_exists = db.execute(
+        select(Conversation.id).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == user_id
+        )
     ).first()
     
-    if not conversation:
+    if not conversation_exists:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
-    # Find the last user message (the problem)
-    last_problem = None
-    for msg in reversed(conversation.messages):
-        if msg.role == "user":
-            last_problem = msg.content
-            break
+    # Find the last user message (the problem): one row, one body
+    last_problem = db.execute(
+        select(Message.content).where(
+            Message.conversation_id == conversation_id,
+            Message.role == "user"
+        ).order_by(Message.created_at.desc(), Message.id.desc()).limit(1)
+    ).scalar()
     
     if not last_problem:
         raise HTTPException(status_code=400, detail="No problem found in conversation")
     
     # Generate graph
-    graph_path = chat_engine.generate_graph(last_problem)
+    with track_usage() as usage:
+        graph_path = chat_engine.generate_graph(last_problem)
+    save_usage(db, usage.records, user_id, conversation_id)
+    db.commit()
     
     if not graph_path:
+        if deadline_exceeded():
+            raise HTTPException(status_code=504, detail="Graph generation timed out")
         raise HTTPException(status_code=500, detail="Failed to generate graph")
     
-    # Read and return as base64
-    with open(graph_path, "rb") as f:
-        graph_base64 = base64.b64encode(f.read()).decode("utf-8")
+    # Return stored graphs as base64 (Firebase URLs are loaded by the client)
+    data = get_graph_storage().read_bytes(graph_path)
+    graph_base64 = base64.b64encode(data).decode("utf-8") if data else None
     
     return {
         "graph_base64": graph_base64,
@@ -314,19 +644,81 @@ async def generate_graph_for_conversation(
     }
 
 
+@app.get("/chat/{conversation_id}/messages/{message_id}/graph")
+async def get_message_graph(
+    conversation_id: int,
+    message_id: int,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Poll a message's graph: status is pending, ready or none."""
+    row = db.execute(
+        select(Message.has_graph, Message.graph_path, Message.graph_pending)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(
+            Message.id == message_id,
+            Message.conversation_id == conversation_id,
+            Conversation.user_id == user.id
+        )
+    ).first()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Message not found")
+    
+    if row.graph_pending:
+        status = "pending"
+    elif row.has_graph:
+        status = "ready"
+    else:
+        status = "none"
+    return {"status": status, "graph_path": row.graph_path}
+
+
+# ============== Admin Routes ==============
+
+@app.get("/admin/usage", response_model=list[UsageReportRow])
+async def admin_usage(
+    group_by: str = Query("day", pattern="^(user|day|model)$"),
+    since: datetime | None = Query(None),
+    until: datetime | None = Query(None),
+    admin: User = Depends(get_admin_user),
+    db: Session = Depends(get_db)
+):
+    """LLM token/latency totals grouped by user, day or model over [since, until)."""
+    return usage_report(db, group_by, since, until)
+
+
+# ============== WebSocket ==============
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket):
+    """Persistent chat session: authenticate once, then stream turns."""
+    await ChatSocketSession(websocket, run_chat_turn, list_conversations).serve()
+
+
 # ============== Static Files ==============
 
 @app.get("/graph/{filename}")
 async def serve_graph(filename: str):
-    """Serve generated graph images."""
-    file_path = f"outputs/{filename}"
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="image/png")
-    raise HTTPException(status_code=404, detail="Graph not found")
+    """Serve generated graph images from the shared graph storage."""
+    if not is_valid_key(filename):
+        raise HTTPException(status_code=404, detail="Graph not found")
+    
+    stream = await run_in_threadpool(get_graph_storage().open_stream, filename)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Graph not found")
+    
+    # Filenames are unique per render, so the content never changes
+    return StreamingResponse(
+        stream,
+        media_type=media_type(filename),
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
 
 
 # ============== Entry Point ==============
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=7860)
\ No newline at end of file
+    # log_config=None keeps uvicorn from replacing the queued handlers set up above
+    uvicorn.run(app, host="0.0.0.0", port=7860, log_config=None)
\ No newline at end of file
@@ -3,7 +3,7 @@ Authentication - Google OAuth + JWT tokens
 """
 
 import os
-import httpx
+import logging
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import HTTPException, Depends, status
@@ -11,10 +11,12 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from database import get_db, User
 
+logger = logging.getLogger(__name__)
+
 # Configuration
 JWT_SECRET = os.getenv("JWT_SECRET")
 if not JWT_SECRET:
-    print("CRITICAL WARNING: JWT_SECRET not found! Auth will fail.")
+    logger.critical("JWT_SECRET not found! Auth will fail.")
 
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRY_HOURS = 24 * 7  # 1 week
@@ -26,6 +28,13 @@ GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:7860")
 
+# Comma-separated emails allowed to use /admin routes
+ADMIN_EMAILS = {
+    email.strip().lower()
+    for email in os.getenv("ADMIN_EMAILS", "").split(",")
+    if email.strip()
+}
+
 security = HTTPBearer(auto_error=False)
 
 
@@ -59,7 +68,12 @@ async def get_current_user(
     if not credentials:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    payload = verify_jwt_token(credentials.credentials)
+    return get_user_from_token(db, credentials.credentials)
+
+
+def get_user_from_token(db: Session, token: str) -> User:
+    """Resolve a JWT to its user (shared by HTTP routes and the WebSocket)."""
+    payload = verify_jwt_token(token)
     user_id = int(payload.get("sub"))
     
     user = db.query(User).filter(User.id == user_id).first()
@@ -69,6 +83,13 @@ async def get_current_user(
     return user
 
 
+async def get_admin_user(user: User = Depends(get_current_user)) -> User:
+    """Dependency for admin-only routes."""
+    if not user.email or user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+
 async def get_optional_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
@@ -100,6 +121,8 @@ def get_google_auth_url() -> str:
 
 async def exchange_google_code(code: str) -> dict:
     """Exchange Google auth code for user info."""
+    import httpx  # only needed at login; kept off the startup import path
+    
     redirect_uri = f"{BACKEND_URL}/auth/callback/google"
     
     async with httpx.AsyncClient() as client:
@@ -3,14 +3,26 @@ Chat Engine - Conversational AI with context management
 Handles multi-turn conversations and structured responses.
 """
 
+import os
+import logging
 import re
-from typing import Optional
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Optional
+from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 from database import Conversation, Message
-from math_solver import MathSolver
-from graph_renderer import GraphRenderer
+from math_solver import MathSolver, DEADLINE_NOTE, TRUNCATED_NOTE
+from graph_renderer import GraphRenderer, TIMEOUT_ERROR
 from prompts import GRAPH_KEYWORDS
-from firebase_utils import upload_graph
+from graph_storage import get_graph_storage
+from graph_sweep import sweep_requested, animation_requested, parse_sweep
+from usage import track_usage, current_tracker, record_llm_call
+from solution_cache import SolutionCache
+from deadline import time_left
+
+logger = logging.getLogger(__name__)
 
 # Graph offer phrases to detect when AI should offer graph
 GRAPH_OFFER_PATTERNS = [
@@ -21,13 +33,187 @@ GRAPH_OFFER_PATTERNS = [
     r"function|equation|curve"
 ]
 
+GRAPH_OFFER_TEXT = "Would you like me to generate a graph"
+
+# Scans read only this much of each message body
+PREVIEW_CHARS = 200
+
+
+def message_summaries(db: Session, conversation_id: int, role: Optional[str] = None):
+    """
+    Lightweight rows for scanning a conversation, newest first: id, role,
+    created_at, has_graph, preview (first PREVIEW_CHARS chars) and length.
+    Full bodies stay in the database; fetch one with message_content().
+    """
+    stmt = select(
+        Message.id, Message.role, Message.created_at, Message.has_graph,
+        func.substr(Message.content, 1, PREVIEW_CHARS).label("preview"),
+        func.length(Message.content).label("length")
+    ).where(
+        Message.conversation_id == conversation_id
+    ).order_by(Message.created_at.desc(), Message.id.desc())
+    if role:
+        stmt = stmt.where(Message.role == role)
+    return db.execute(stmt)
+
+
+def message_content(db: Session, message_id: int) -> Optional[str]:
+    return db.execute(select(Message.content).where(Message.id == message_id)).scalar()
+
+
+# Speculative graph budget: concurrent renders, unclaimed results kept, and their lifetime
+SPECULATIVE_MAX_WORKERS = 2
+SPECULATIVE_MAX_PENDING = 8
+SPECULATIVE_TTL_SECONDS = 300
+SPECULATIVE_WAIT_SECONDS = 30
+
+# Tail of a render error sent back to the model for a repair
+REPAIR_ERROR_CHARS = 1500
+
+# Graph renders that outlive their request keep running on this pool
+GRAPH_MAX_WORKERS = 4
+
+GRAPH_PENDING_TEXT = "Your graph is still being drawn; it will appear here in a moment."
+
+
+class SpeculativeGraphCache:
+    """
+    Graphs rendered in the background when a graph is offered, keyed by
+    conversation, so a "yes" can be answered from an already-finished render.
+    Unclaimed renders expire after the TTL and their image files are removed.
+    """
+    
+    def __init__(
+        self,
+        render: Callable[[str], Optional[str]],
+        max_workers: int = SPECULATIVE_MAX_WORKERS,
+        max_pending: int = SPECULATIVE_MAX_PENDING,
+        ttl: float = SPECULATIVE_TTL_SECONDS
+    ):
+        self.render = render
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-graph")
+        self._entries: dict[int, tuple[str, Future, float]] = {}
+        self._lock = threading.Lock()
+    
+    def start(self, conversation_id: int, problem: str) -> bool:
+        """Begin rendering for an offered graph. Returns False if over budget."""
+        with self._lock:
+            self._expire_locked()
+            self._discard_entry(self._entries.pop(conversation_id, None))
+            if len(self._entries) >= self.max_pending:
+                return False
+            future = self._executor.submit(self._render_tracked, problem)
+            self._entries[conversation_id] = (problem, future, time.monotonic())
+            return True
+    
+    def _render_tracked(self, problem: str) -> tuple[Optional[str], list[dict]]:
+        # Runs outside any request, so collect usage here and hand it over on take()
+        with track_usage() as tracker:
+            img_path = self.render(problem)
+        return img_path, tracker.records
+    
+    def take(self, conversation_id: int, problem: str, timeout: float = SPECULATIVE_WAIT_SECONDS):
+        """
+        Claim the render for this offer, waiting up to timeout if still running.
+        Returns the image path, None if unavailable, or the render's Future if it
+        is still running after the wait (now owned by the caller).
+        """
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+        if not entry:
+            return None
+        if entry[0] != problem:
+            self._discard_entry(entry)
+            return None
+        try:
+            img_path, records = entry[1].result(timeout=timeout)
+        except FutureTimeout:
+            return entry[1]
+        except Exception:
+            self._discard_entry(entry)
+            return None
+        
+        # Bill the speculative calls to the turn that used them, flagged as cache hits
+        tracker = current_tracker()
+        if tracker:
+            tracker.extend(records, cache_hit=True)
+        return img_path
+    
+    def discard(self, conversation_id: int):
+        """Drop a pending offer (the user moved on without accepting)."""
+        with self._lock:
+            self._discard_entry(self._entries.pop(conversation_id, None))
+    
+    def _expire_locked(self):
+        now = time.monotonic()
+        for conversation_id, entry in list(self._entries.items()):
+            if now - entry[2] > self.ttl:
+                self._discard_entry(self._entries.pop(conversation_id))
+    
+    @staticmethod
+    def _discard_entry(entry):
+        if not entry:
+            return
+        future = entry[1]
+        if not future.cancel():
+            future.add_done_callback(_remove_rendered_file)
+
+
+def _remove_rendered_file(future: Future):
+    try:
+        img_path, _ = future.result()
+    except Exception:
+        return
+    if img_path:
+        try:
+            os.remove(img_path)
+        except OSError:
+            pass
+
+
+class PendingGraph:
+    """
+    A graph that missed the request deadline and keeps rendering in the background.
+    The caller registers where to store it with on_done().
+    """
+    
+    def __init__(self, future: Future):
+        self.future = future
+    
+    def on_done(self, callback: Callable[[Optional[str], list[dict]], None]):
+        """callback(graph_path, usage_records) runs in the worker thread when finished."""
+        def done(future: Future):
+            try:
+                graph_path, records = future.result()
+            except Exception:
+                logger.exception("Background graph failed")
+                graph_path, records = None, []
+            callback(graph_path, records)
+        
+        self.future.add_done_callback(done)
+
 
 class ChatEngine:
     """Manages conversational flow with the AI."""
     
-    def __init__(self, api_key: str = None):
+    def __init__(
+        self,
+        api_key: str = None,
+        speculative_graphs: bool = False,
+        graph_repair: bool = True,
+        solution_cache: bool = True
+    ):
         self.solver = MathSolver(api_key=api_key)
         self.renderer = GraphRenderer()
+        # Identical problems (e.g. from past papers) reuse earlier answers and graphs
+        self.cache = SolutionCache(self.solver.cache_version) if solution_cache else None
+        # One LLM retry, given the error, when plotting code fails validation or rendering
+        self.graph_repair = graph_repair
+        self._graph_executor = ThreadPoolExecutor(max_workers=GRAPH_MAX_WORKERS, thread_name_prefix="graph")
+        # Optionally pre-render offered graphs so accepting one is instant
+        self.speculative = SpeculativeGraphCache(self.render_graph) if speculative_graphs else None
     
     def should_offer_graph(self, problem: str, solution: str) -> bool:
         """Determine if we should offer to generate a graph."""
@@ -47,7 +233,7 @@ class ChatEngine:
         formatted = solution.strip()
         
         if offer_graph:
-            formatted += "\n\n---\n📊 **Would you like me to generate a graph for this?** (Just say 'yes' or 'show graph')"
+            formatted += f"\n\n---\n📊 **{GRAPH_OFFER_TEXT} for this?** (Just say 'yes' or 'show graph')"
         
         return formatted
     
@@ -57,82 +243,213 @@ class ChatEngine:
         msg_lower = message.lower().strip()
         return any(word in msg_lower for word in confirmations) and len(msg_lower) < 50
     
-    def get_conversation_context(self, conversation: Conversation, limit: int = 10) -> list[dict]:
-        """Build message history for context."""
-        messages = conversation.messages[-limit:] if conversation.messages else []
+    def get_conversation_context(self, db: Session, conversation_id: int, limit: int = 10) -> list[dict]:
+        """Build message history for context (only the last `limit` bodies are read)."""
+        rows = db.execute(
+            select(Message.role, Message.content)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(limit)
+        ).all()
         return [
-            {"role": msg.role, "content": msg.content}
-            for msg in messages
+            {"role": row.role, "content": row.content}
+            for row in reversed(rows)
         ]
     
+    def has_pending_graph_offer(self, db: Session, conversation_id: int) -> bool:
+        """Whether the latest assistant message offered a graph (matched in SQL)."""
+        offered = db.execute(
+            select(Message.content.contains(GRAPH_OFFER_TEXT))
+            .where(Message.conversation_id == conversation_id, Message.role == "assistant")
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(1)
+        ).scalar()
+        return bool(offered)
+    
+    def find_original_problem(self, db: Session, conversation_id: int) -> Optional[str]:
+        """Latest user message that isn't a graph confirmation, scanning previews only."""
+        for row in message_summaries(db, conversation_id, role="user"):
+            # Confirmations are short, so the preview is the whole message
+            is_complete = row.length is not None and row.length <= PREVIEW_CHARS
+            if is_complete and self.is_graph_confirmation(row.preview):
+                continue
+            return message_content(db, row.id)
+        return None
+    
     def chat(
         self,
         user_message: str,
         conversation: Optional[Conversation],
-        db: Session
+        db: Session,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> tuple[str, bool, Optional[str]]:
         """
         Process user message and return AI response.
-        Returns: (response_text, should_offer_graph, graph_path)
+        on_token, if given, receives solution text deltas as they stream in;
+        the returned response_text is still the complete, formatted reply.
+        Returns: (response_text, should_offer_graph, graph_path); graph_path is a
+        PendingGraph when the graph could not finish within the request deadline.
         """
         # Check if this is a graph confirmation for previous message
-        if conversation and conversation.messages:
-            last_assistant = None
-            for msg in reversed(conversation.messages):
-                if msg.role == "assistant":
-                    last_assistant = msg
-                    break
-            
-            if last_assistant and "Would you like me to generate a graph" in last_assistant.content:
-                if self.is_graph_confirmation(user_message):
-                    # Find the original problem
-                    original_problem = None
-                    for msg in reversed(conversation.messages):
-                        if msg.role == "user" and not self.is_graph_confirmation(msg.content):
-                            original_problem = msg.content
-                            break
-                    
-                    if original_problem:
-                        graph_path = self.generate_graph(original_problem)
-                        if graph_path:
-                            return "Here's the graph you requested:", False, graph_path
-                        else:
-                            return "Sorry, I couldn't generate the graph. Please try with a different problem.", False, None
+        if conversation and self.has_pending_graph_offer(db, conversation.id):
+            if self.is_graph_confirmation(user_message):
+                # Find the original problem
+                original_problem = self.find_original_problem(db, conversation.id)
+                
+                if original_problem:
+                    graph_path = self.cached_graph(original_problem)
+                    if not graph_path and self.speculative:
+                        left = time_left()
+                        wait = SPECULATIVE_WAIT_SECONDS if left is None else min(SPECULATIVE_WAIT_SECONDS, left)
+                        taken = self.speculative.take(conversation.id, original_problem, timeout=wait)
+                        if isinstance(taken, Future):
+                            # Out of time but nearly drawn: hand this render on instead of starting another
+                            graph_path = PendingGraph(self._publish_when_done(original_problem, taken))
+                        elif taken:
+                            graph_path = self.publish_graph(taken)
+                            self.remember_graph(original_problem, graph_path)
+                    if not graph_path:
+                        graph_path = self.generate_graph_within_deadline(original_problem)
+                    if isinstance(graph_path, PendingGraph):
+                        return GRAPH_PENDING_TEXT, False, graph_path
+                    if graph_path:
+                        return "Here's the graph you requested:", False, graph_path
+                    else:
+                        return "Sorry, I couldn't generate the graph. Please try with a different problem.", False, None
+        
+        # Any pending offer in this conversation was not accepted
+        if self.speculative and conversation:
+            self.speculative.discard(conversation.id)
         
         # Check if user explicitly wants a graph
         if self.solver.needs_graph(user_message):
-            solution = self.solver.solve(user_message)
-            graph_path = self.generate_graph(user_message)
+            solution = self.solve(user_message, on_token=on_token)
+            graph_path = self.generate_graph_within_deadline(user_message)
             return solution, False, graph_path
         
         # Regular problem solving
-        solution = self.solver.solve(user_message)
+        solution = self.solve(user_message, on_token=on_token)
         offer_graph = self.should_offer_graph(user_message, solution)
         formatted = self.format_solution(solution, offer_graph)
         
+        if offer_graph and self.speculative and conversation and not self.cached_graph(user_message):
+            self.speculative.start(conversation.id, user_message)
+        
         return formatted, offer_graph, None
     
-    def generate_graph(self, problem: str) -> Optional[str]:
-        """Generate graph for a problem."""
-        code_response = self.solver.generate_graph_code(problem)
+    def solve(self, problem: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """MathSolver.solve behind the solution cache; complete answers are cached."""
+        started = time.perf_counter()
+        cached = self.cache.get_solution(problem) if self.cache else None
+        if cached:
+            record_llm_call("solve", self.solver.model, None, started, cache_hit=True)
+            if on_token:
+                on_token(cached)
+            return cached
+        
+        solution = self.solver.solve(problem, on_token=on_token)
+        # Never cache upstream errors or answers cut short by a deadline
+        cacheable = (
+            solution
+            and not solution.startswith("Error:")
+            and not solution.endswith((TRUNCATED_NOTE, DEADLINE_NOTE))
+        )
+        if self.cache and cacheable:
+            self.cache.store_solution(problem, solution)
+        return solution
+    
+    def cached_graph(self, problem: str) -> Optional[str]:
+        return self.cache.get_graph(problem) if self.cache else None
+    
+    def remember_graph(self, problem: str, graph_path: Optional[str]):
+        if self.cache and graph_path:
+            self.cache.store_graph(problem, graph_path)
+    
+    def render_graph(self, problem: str) -> Optional[str]:
+        """Generate plotting code and render it locally. Returns the image path."""
+        # "for k = -3..3" style problems get one panel per value, rendered in parallel
+        sweep = sweep_requested(problem)
+        animate = sweep and animation_requested(problem)
+        code_response = self.solver.generate_graph_code(problem, sweep=sweep)
         code = self.renderer.extract_code(code_response)
         
-        if code:
-            img_path, error = self.renderer.render(code)
-            if img_path:
-                # Try uploading to Firebase
-                public_url = upload_graph(img_path)
-                if public_url:
-                    return public_url
-                
-                # Fallback to local path relative to API
-                # img_path is like "outputs/xyz.png"
-                # We return "/graph/xyz.png" which maps to the static file route
-                filename = img_path.split("/")[-1]
-                return f"/graph/{filename}"
-            
+        if not code:
+            return None
+        
+        img_path, error = self._render_code(code, animate)
+        # A timeout means slow code, not a fixable mistake; don't spend another 15s
+        if error and self.graph_repair and not error.startswith(TIMEOUT_ERROR):
+            logger.info("Graph code failed, requesting repair: %s", error.strip()[-200:])
+            repair_response = self.solver.repair_graph_code(problem, code, error[-REPAIR_ERROR_CHARS:])
+            repaired = self.renderer.extract_code(repair_response)
+            if repaired:
+                img_path, error = self._render_code(repaired, animate)
+        
+        return img_path
+    
+    def _render_code(self, code: str, animate: bool = False) -> tuple[Optional[str], Optional[str]]:
+        if parse_sweep(code):
+            return self.renderer.render_sweep(code, animate=animate)
+        return self.renderer.render(code)
+    
+    def publish_graph(self, img_path: str) -> str:
+        """Hand a rendered image to the graph storage backend. Returns its URL/path."""
+        # Firebase URL, or "/graph/xyz.png" served by the /graph/{filename} route
+        return get_graph_storage().save(img_path)
+    
+    def generate_graph(self, problem: str) -> Optional[str]:
+        """Generate graph for a problem (or reuse the cached one)."""
+        graph_path = self.cached_graph(problem)
+        if graph_path:
+            return graph_path
+        
+        img_path = self.render_graph(problem)
+        if img_path:
+            graph_path = self.publish_graph(img_path)
+            self.remember_graph(problem, graph_path)
+            return graph_path
+        
         return None
     
+    def _generate_graph_tracked(self, problem: str) -> tuple[Optional[str], list[dict]]:
+        # Runs on the graph pool, outside the request context: collect usage here
+        with track_usage() as tracker:
+            graph_path = self.generate_graph(problem)
+        return graph_path, tracker.records
+    
+    def generate_graph_within_deadline(self, problem: str):
+        """
+        Generate a graph, waiting no longer than the request deadline allows.
+        Returns the graph path, None on failure, or a PendingGraph if still running.
+        """
+        future = self._graph_executor.submit(self._generate_graph_tracked, problem)
+        try:
+            graph_path, records = future.result(timeout=time_left())
+        except FutureTimeout:
+            return PendingGraph(future)
+        
+        tracker = current_tracker()
+        if tracker:
+            tracker.extend(records)
+        return graph_path
+    
+    def _publish_when_done(self, problem: str, render: Future) -> Future:
+        """Future of (graph_path, usage_records) for a speculative render still running."""
+        published = Future()
+        
+        def done(future: Future):
+            try:
+                img_path, records = future.result()
+                graph_path = self.publish_graph(img_path) if img_path else None
+                self.remember_graph(problem, graph_path)
+                # Billed like a claimed speculative render (see SpeculativeGraphCache.take)
+                published.set_result((graph_path, [{**r, "cache_hit": True} for r in records]))
+            except Exception as e:
+                published.set_exception(e)
+        
+        render.add_done_callback(done)
+        return published
+    
     def generate_title(self, first_message: str) -> str:
         """Generate a short title for the conversation."""
         # Take first 50 chars, clean up
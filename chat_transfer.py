@@ -0,0 +1,209 @@
+"""
+Chat Transfer - NDJSON export and bulk import of conversations
+Export streams rows from a server-side cursor so memory stays flat;
+import inserts in batched transactions.
+
+Record format (one JSON object per line):
+    {"type": "conversation", "id": 1, "title": "...", "created_at": "...", "updated_at": "..."}
+    {"type": "message", "conversation_id": 1, "role": "user", "content": "...",
+     "has_graph": false, "graph_path": null, "created_at": "..."}
+Messages always follow the conversation they belong to. An imported graph_path
+is kept only if one of the importing user's own messages already shows that
+graph (e.g. re-importing an export); any other is dropped, so an import can't
+claim, and later delete, someone else's stored image.
+"""
+
+import json
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import select, insert
+from sqlalchemy.orm import Session
+from database import SessionLocal, Conversation, Message
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 500
+MAX_LINE_BYTES = 1024 * 1024
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, default=lambda o: o.isoformat(), ensure_ascii=False) + "\n"
+
+
+def iter_export_lines(user_id: int) -> Iterator[str]:
+    """
+    Yield NDJSON lines for all of a user's conversations and messages.
+    Opens its own session because it outlives the request dependency.
+    """
+    stmt = (
+        select(
+            Conversation.id, Conversation.title,
+            Conversation.created_at, Conversation.updated_at,
+            Message.role, Message.content, Message.has_graph,
+            Message.graph_path, Message.created_at.label("message_created_at"),
+        )
+        .outerjoin(Message, Message.conversation_id == Conversation.id)
+        .where(Conversation.user_id == user_id)
+        .order_by(Conversation.id, Message.created_at, Message.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    db = SessionLocal()
+    try:
+        current_id = None
+        for row in db.execute(stmt):
+            if row.id != current_id:
+                current_id = row.id
+                yield _dumps({
+                    "type": "conversation",
+                    "id": row.id,
+                    "title": row.title,
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at,
+                })
+            if row.role is not None:
+                yield _dumps({
+                    "type": "message",
+                    "conversation_id": row.id,
+                    "role": row.role,
+                    "content": row.content,
+                    "has_graph": bool(row.has_graph),
+                    "graph_path": row.graph_path,
+                    "created_at": row.message_created_at,
+                })
+    finally:
+        db.close()
+
+
+class ImportRecordError(ValueError):
+    """Raised for a malformed import line; carries the 1-based line number."""
+
+    def __init__(self, line_no: int, message: str):
+        super().__init__(f"Line {line_no}: {message}")
+        self.line_no = line_no
+
+
+def _parse_datetime(value: Optional[str]) -> datetime:
+    return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+
+class ConversationImporter:
+    """
+    Buffers parsed records and writes them in batched transactions.
+    Batches committed before an error are kept; the failing batch is rolled back.
+    """
+
+    def __init__(self, db: Session, user_id: int, batch_size: int = IMPORT_BATCH_SIZE):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.id_map: dict = {}  # source conversation id -> new id (after flush)
+        self.pending_conversations: dict = {}  # source id -> Conversation
+        self.pending_messages: list[tuple] = []  # (source conversation id, row dict)
+        self.conversation_count = 0
+        self.message_count = 0
+        self.line_no = 0
+        self._own_graph_paths: Optional[set] = None  # loaded on the first message with a graph
+
+    def add_lines(self, lines: list[bytes]):
+        for line in lines:
+            self.add_line(line)
+
+    def add_line(self, line: bytes):
+        """Parse and buffer one NDJSON line, flushing when the batch is full."""
+        self.line_no += 1
+        if not line.strip():
+            return
+        if len(line) > MAX_LINE_BYTES:
+            raise ImportRecordError(self.line_no, "line too long")
+        try:
+            record = json.loads(line)
+            kind = record["type"]
+            if kind == "conversation":
+                self._add_conversation(record)
+            elif kind == "message":
+                self._add_message(record)
+            else:
+                raise ImportRecordError(self.line_no, f"unknown record type {kind!r}")
+        except ImportRecordError:
+            raise
+        except (ValueError, KeyError, TypeError) as e:
+            raise ImportRecordError(self.line_no, f"invalid record ({e})")
+
+        if len(self.pending_conversations) + len(self.pending_messages) >= self.batch_size:
+            self.flush()
+
+    def _add_conversation(self, record: dict):
+        source_id = record["id"]
+        if source_id in self.id_map or source_id in self.pending_conversations:
+            raise ImportRecordError(self.line_no, f"duplicate conversation id {source_id}")
+        title = record.get("title") or "New Chat"
+        if not isinstance(title, str):
+            raise ImportRecordError(self.line_no, "title must be a string")
+        self.pending_conversations[source_id] = Conversation(
+            user_id=self.user_id,
+            title=title[:255],
+            created_at=_parse_datetime(record.get("created_at")),
+            updated_at=_parse_datetime(record.get("updated_at")),
+        )
+
+    def _add_message(self, record: dict):
+        source_id = record["conversation_id"]
+        if source_id not in self.id_map and source_id not in self.pending_conversations:
+            raise ImportRecordError(self.line_no, f"message for unknown conversation {source_id}")
+        role = record["role"]
+        if role not in ("user", "assistant"):
+            raise ImportRecordError(self.line_no, f"invalid role {role!r}")
+        content = record["content"]
+        if not isinstance(content, str):
+            raise ImportRecordError(self.line_no, "content must be a string")
+        graph_path = record.get("graph_path")
+        if graph_path is not None and graph_path not in self._own_graphs():
+            graph_path = None
+        self.pending_messages.append((source_id, {
+            "role": role,
+            "content": content,
+            "has_graph": graph_path is not None,
+            "graph_path": graph_path,
+            "created_at": _parse_datetime(record.get("created_at")),
+        }))
+
+    def _own_graphs(self) -> set:
+        """Graph paths already on this user's messages (the only ones an import may reference)."""
+        if self._own_graph_paths is None:
+            self._own_graph_paths = set(self.db.execute(
+                select(Message.graph_path)
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .where(Conversation.user_id == self.user_id, Message.graph_path.isnot(None))
+                .distinct()
+            ).scalars())
+        return self._own_graph_paths
+
+    def flush(self):
+        """Write buffered records in one transaction."""
+        if not self.pending_conversations and not self.pending_messages:
+            return
+        try:
+            if self.pending_conversations:
+                self.db.add_all(self.pending_conversations.values())
+                self.db.flush()
+                for source_id, conversation in self.pending_conversations.items():
+                    self.id_map[source_id] = conversation.id
+
+            if self.pending_messages:
+                rows = [
+                    {"conversation_id": self.id_map[source_id], **row}
+                    for source_id, row in self.pending_messages
+                ]
+                self.db.execute(insert(Message), rows)
+
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            for source_id in self.pending_conversations:
+                self.id_map.pop(source_id, None)
+            raise
+
+        self.conversation_count += len(self.pending_conversations)
+        self.message_count += len(self.pending_messages)
+        self.pending_conversations = {}
+        self.pending_messages = []
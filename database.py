@@ -1,17 +1,34 @@
 """
 Database Setup - SQLite with SQLAlchemy
-Tables: users, conversations, messages
+Tables: users, conversations, messages, llm_usage, graph_blobs, idempotency_keys,
+        solution_cache
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, deferred
 from datetime import datetime
 import os
 
+from search import init_search_index
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./math_agent.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# check_same_thread is a sqlite3-only option
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+engine = create_engine(DATABASE_URL, connect_args=connect_args)
+
+
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Lets retention reclaim space with incremental_vacuum; only takes
+        # effect on a new database ('python retention.py' converts existing ones)
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -37,13 +54,20 @@ class Conversation(Base):
     __tablename__ = "conversations"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     title = Column(String(255), default="New Chat")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", order_by="Message.created_at")
+    # Never loaded implicitly: query projections, or opt in with selectinload()
+    messages = relationship(
+        "Message",
+        back_populates="conversation",
+        order_by="Message.created_at",
+        cascade="all, delete-orphan",
+        lazy="raise_on_sql"
+    )
 
 
 class Message(Base):
@@ -51,19 +75,107 @@ class Message(Base):
     __tablename__ = "messages"
     
     id = Column(Integer, primary_key=True, index=True)
-    conversation_id = Column(Integer, ForeignKey("conversations.id"))
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), index=True)
     role = Column(String(20))  # user, assistant
-    content = Column(Text)
+    # Large; loaded only when asked for (select the column or undefer()),
+    # and an accidental lazy load raises instead of issuing a query per row
+    content = deferred(Column(Text), raiseload=True)
     has_graph = Column(Boolean, default=False)
     graph_path = Column(String(500), nullable=True)
+    graph_pending = Column(Boolean, default=False)  # rendering after the response went out
     created_at = Column(DateTime, default=datetime.utcnow)
     
     conversation = relationship("Conversation", back_populates="messages")
 
 
+class LLMUsage(Base):
+    """One upstream LLM call: tokens, model and latency, for usage reporting."""
+    __tablename__ = "llm_usage"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    conversation_id = Column(Integer, nullable=True)  # kept after the conversation is purged
+    message_id = Column(Integer, nullable=True)  # assistant message; None for standalone graph calls
+    kind = Column(String(30))  # solve, graph_code, graph_repair
+    model = Column(String(100))
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cached_tokens = Column(Integer, default=0)  # provider-side prompt cache
+    latency_ms = Column(Integer)
+    cache_hit = Column(Boolean, default=False)  # served from one of our caches (e.g. speculative graph)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        Index("ix_llm_usage_user_created", "user_id", "created_at"),
+        Index("ix_llm_usage_model_created", "model", "created_at"),
+    )
+
+
+class GraphBlob(Base):
+    """Rendered graph image, for the 'database' graph storage backend."""
+    __tablename__ = "graph_blobs"
+    
+    id = Column(Integer, primary_key=True)
+    key = Column(String(255), unique=True, index=True)  # filename served at /graph/{key}
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    """Client-supplied Idempotency-Key and the response it produced, for safe retries."""
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    scope = Column(String(100))  # endpoint, e.g. "POST /chat"
+    key = Column(String(255))
+    request_hash = Column(String(64))  # same key with a different body is rejected
+    status = Column(String(20), default="pending")  # pending, done
+    response_body = Column(Text, nullable=True)  # JSON, replayed to duplicates
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "scope", "key", name="uq_idempotency_user_scope_key"),
+    )
+
+
+class SolutionCacheEntry(Base):
+    """Solved problem (and its graph) reused for identical questions; see solution_cache.py."""
+    __tablename__ = "solution_cache"
+    
+    id = Column(Integer, primary_key=True)
+    key = Column(String(64), unique=True, index=True)  # normalized problem + model/prompt version
+    problem = Column(Text)
+    solution = Column(Text, nullable=True)
+    graph_path = Column(String(500), nullable=True, index=True)  # kept when messages using it are purged
+    hits = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def _add_missing_columns():
+    """create_all never alters existing tables; add columns introduced since (all nullable)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(
+                        f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                    )
+
+
 def init_db():
-    """Create all tables."""
+    """Create all tables and the full-text search index."""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    # create_all skips indexes on tables that already exist; add any missing ones
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    init_search_index(engine)
 
 
 def get_db():
@@ -0,0 +1,87 @@
+"""
+Request Deadlines - one time budget shared by every stage of a request
+The route opens a deadline; MathSolver, GraphRenderer and the graph upload
+size their timeouts from what is left, so a request can't run past it.
+LLM calls also go through run_within_deadline(), so a stalled read can't
+hold a request past it either. Work started outside a deadline (background
+graph renders) uses each stage's own limit.
+"""
+
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+DEADLINE_HEADER = "X-Request-Deadline"  # seconds, overrides the default per request
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+MIN_DEADLINE_SECONDS = 5
+MAX_DEADLINE_SECONDS = 120
+
+# Threads for run_within_deadline; an abandoned call holds one until its own timeout ends it
+WATCHDOG_MAX_WORKERS = 32
+
+_current_deadline: ContextVar = ContextVar("request_deadline", default=None)
+_watchdog_pool = ThreadPoolExecutor(max_workers=WATCHDOG_MAX_WORKERS, thread_name_prefix="deadline")
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before a stage could start."""
+
+
+def parse_deadline(value: Optional[str]) -> float:
+    """Seconds from the X-Request-Deadline header, clamped; the default if absent or invalid."""
+    try:
+        seconds = float(value) if value else DEFAULT_DEADLINE_SECONDS
+    except ValueError:
+        seconds = DEFAULT_DEADLINE_SECONDS
+    return min(max(seconds, MIN_DEADLINE_SECONDS), MAX_DEADLINE_SECONDS)
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Run the block under a deadline; a nested deadline never extends an outer one."""
+    expires = time.monotonic() + seconds
+    outer = _current_deadline.get()
+    token = _current_deadline.set(min(expires, outer) if outer else expires)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Seconds left in the current deadline, or None outside of one."""
+    expires = _current_deadline.get()
+    if expires is None:
+        return None
+    return max(0.0, expires - time.monotonic())
+
+
+def stage_timeout(limit: float) -> float:
+    """Timeout for one stage: its own limit, capped by what's left of the request."""
+    left = time_left()
+    return limit if left is None else min(limit, left)
+
+
+def deadline_exceeded() -> bool:
+    return time_left() == 0
+
+
+def run_within_deadline(fn: Callable, *args, **kwargs):
+    """
+    fn(*args, **kwargs), returning by the deadline even if fn is stuck in a
+    blocking read: it runs on a helper thread (in this context) and is
+    abandoned, left to end on its own timeouts, with DeadlineExceeded raised
+    here. Outside a deadline fn simply runs in this thread.
+    """
+    left = time_left()
+    if left is None:
+        return fn(*args, **kwargs)
+    future = _watchdog_pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+    try:
+        return future.result(timeout=left)
+    except FutureTimeout:
+        raise DeadlineExceeded("Request deadline exceeded") from None
@@ -4,73 +4,145 @@ Firebase Storage Integration
 Uploads generated graphs to Firebase Storage and returns public URLs.
 """
 import os
-import firebase_admin
-from firebase_admin import credentials, storage
+import logging
+import json
+import threading
 from datetime import datetime
 import uuid
+from urllib.parse import unquote
+from deadline import stage_timeout
 
-# Initialize Firebase App
-# We check if app is already initialized to avoid errors on reload
-import json
+logger = logging.getLogger(__name__)
 
-# Initialize Firebase App
-# We check if app is already initialized to avoid errors on reload
-if not firebase_admin._apps:
-    bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
-    cred = None
-    
-    # Priority 1: Credential JSON string in env var (for Cloud deployment)
-    json_creds = os.getenv("FIREBASE_CREDENTIALS_JSON")
-    if json_creds:
-        try:
-            cred_dict = json.loads(json_creds)
-            cred = credentials.Certificate(cred_dict)
-            print("Loaded Firebase credentials from environment variable.")
-        except Exception as e:
-            print(f"Error parsing FIREBASE_CREDENTIALS_JSON: {e}")
+# google-cloud-storage's own default; a request deadline caps it further
+UPLOAD_TIMEOUT = 60
+
+# firebase_admin pulls in the whole Google Cloud stack, so it is imported and
+# initialized on first use (or by the startup warm-up), not at module import.
+_firebase_ready = None  # None = not attempted, True/False = outcome
+_init_lock = threading.Lock()
 
-    # Priority 2: Local file (for local dev)
-    if not cred:
+
+def init_firebase() -> bool:
+    """Initialize the Firebase app once. Returns True if uploads are available."""
+    global _firebase_ready
+    if _firebase_ready is not None:
+        return _firebase_ready
+    
+    with _init_lock:
+        if _firebase_ready is not None:
+            return _firebase_ready
+        
+        bucket_name = os.getenv("FIREBASE_STORAGE_BUCKET")
+        json_creds = os.getenv("FIREBASE_CREDENTIALS_JSON")
         cred_path = os.getenv("FIREBASE_SERVICE_ACCOUNT_PATH", "firebase-credentials.json")
-        if os.path.exists(cred_path):
+        
+        # Nothing configured: skip the heavy import entirely
+        if not bucket_name or not (json_creds or os.path.exists(cred_path)):
+            logger.warning("Firebase credentials or bucket name not found. Graph uploads will fail.")
+            _firebase_ready = False
+            return False
+        
+        import firebase_admin
+        from firebase_admin import credentials
+        
+        # We check if app is already initialized to avoid errors on reload
+        if firebase_admin._apps:
+            _firebase_ready = True
+            return True
+        
+        cred = None
+        
+        # Priority 1: Credential JSON string in env var (for Cloud deployment)
+        if json_creds:
+            try:
+                cred_dict = json.loads(json_creds)
+                cred = credentials.Certificate(cred_dict)
+                logger.info("Loaded Firebase credentials from environment variable.")
+            except Exception as e:
+                logger.error("Error parsing FIREBASE_CREDENTIALS_JSON: %s", e)
+
+        # Priority 2: Local file (for local dev)
+        if not cred and os.path.exists(cred_path):
             cred = credentials.Certificate(cred_path)
-            print(f"Loaded Firebase credentials from file: {cred_path}")
-    
-    if cred and bucket_name:
-        firebase_admin.initialize_app(cred, {
-            'storageBucket': bucket_name
-        })
-        print("Firebase Admin SDK initialized successfully.")
-    else:
-        print("Warning: Firebase credentials or bucket name not found. Graph uploads will fail.")
+            logger.info("Loaded Firebase credentials from file: %s", cred_path)
+        
+        if cred:
+            firebase_admin.initialize_app(cred, {
+                'storageBucket': bucket_name
+            })
+            # Import the storage stack now so the first upload doesn't pay for it
+            from firebase_admin import storage  # noqa: F401
+            logger.info("Firebase Admin SDK initialized successfully.")
+            _firebase_ready = True
+        else:
+            logger.warning("Firebase credentials or bucket name not found. Graph uploads will fail.")
+            _firebase_ready = False
+        
+        return _firebase_ready
+
+
+def firebase_status() -> str:
+    """Readiness label: 'cold' (not initialized yet), 'ready' or 'disabled'."""
+    if _firebase_ready is None:
+        return "cold"
+    return "ready" if _firebase_ready else "disabled"
+
 
 def upload_graph(file_path: str) -> str | None:
     """
     Upload a local image file to Firebase Storage and return its public URL.
     Returns None if upload fails or Firebase is not configured.
     """
-    if not firebase_admin._apps:
-        print("Error: Firebase not initialized. Cannot upload graph.")
+    if not init_firebase():
+        logger.error("Firebase not initialized. Cannot upload graph.")
         return None
         
+    from firebase_admin import storage
+    
     try:
         bucket = storage.bucket()
         
         # Create a unique filename for cloud storage
-        # structure: graphs/{date}/{uuid}.png
+        # structure: graphs/{date}/{uuid}.png (or .gif for animated sweeps)
         date_str = datetime.now().strftime("%Y-%m-%d")
         unique_id = uuid.uuid4().hex
-        blob_name = f"graphs/{date_str}/{unique_id}.png"
+        extension = os.path.splitext(file_path)[1] or ".png"
+        blob_name = f"graphs/{date_str}/{unique_id}{extension}"
         
         blob = bucket.blob(blob_name)
-        blob.upload_from_filename(file_path)
+        blob.upload_from_filename(file_path, timeout=stage_timeout(UPLOAD_TIMEOUT))
         
         # Make public and get URL
-        blob.make_public()
+        blob.make_public(timeout=stage_timeout(UPLOAD_TIMEOUT))
         
-        print(f"Graph uploaded to Firebase: {blob.public_url}")
+        logger.info("Graph uploaded to Firebase: %s", blob.public_url)
         return blob.public_url
         
     except Exception as e:
-        print(f"Failed to upload graph to Firebase: {e}")
+        logger.warning("Failed to upload graph to Firebase: %s", e)
         return None
+
+
+def delete_graph(public_url: str) -> bool:
+    """
+    Delete a previously uploaded graph given its public URL.
+    Returns False if Firebase is not configured or the URL is not ours.
+    """
+    if not init_firebase():
+        return False
+        
+    from firebase_admin import storage
+    
+    try:
+        bucket = storage.bucket()
+        prefix = f"https://storage.googleapis.com/{bucket.name}/"
+        if not public_url.startswith(prefix):
+            return False
+        
+        bucket.blob(unquote(public_url[len(prefix):])).delete()
+        return True
+        
+    except Exception as e:
+        logger.warning("Failed to delete graph from Firebase: %s", e)
+        return False
@@ -6,6 +6,7 @@ interface Message {
   content: string;
   has_graph: boolean;
   graph_path: string | null;
+  graph_pending?: boolean;
   created_at: string;
 }
 
@@ -24,6 +25,23 @@ interface ConversationListItem {
   message_count: number;
 }
 
+interface SearchResult {
+  conversation_id: number;
+  conversation_title: string;
+  message_id: number | null;
+  role: 'user' | 'assistant' | null;
+  snippet: string;
+  created_at: string;
+}
+
+interface SearchResponse {
+  query: string;
+  results: SearchResult[];
+  limit: number;
+  offset: number;
+  has_more: boolean;
+}
+
 interface ChatResponse {
   message: Message;
   conversation_id: number;
@@ -94,9 +112,15 @@ class ApiClient {
   }
 
   // Chat
-  async sendMessage(content: string, conversationId?: number): Promise<ChatResponse> {
+  // Reuse the same idempotencyKey when retrying so the server replays instead of re-solving
+  async sendMessage(
+    content: string,
+    conversationId?: number,
+    idempotencyKey: string = crypto.randomUUID(),
+  ): Promise<ChatResponse> {
     return this.fetch<ChatResponse>('/chat', {
       method: 'POST',
+      headers: { 'Idempotency-Key': idempotencyKey },
       body: JSON.stringify({
         content,
         conversation_id: conversationId,
@@ -104,10 +128,28 @@ class ApiClient {
     });
   }
 
+  // Persistent chat session: authenticates once, then streams turns (see backend ws_chat.py)
+  openChatSocket(): WebSocket {
+    const ws = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/ws/chat`);
+    ws.addEventListener('open', () => {
+      ws.send(JSON.stringify({ type: 'auth', token: this.getToken() }));
+    });
+    ws.addEventListener('message', (event) => {
+      const frame = JSON.parse(event.data);
+      if (frame.type === 'ping') ws.send(JSON.stringify({ type: 'pong' }));
+    });
+    return ws;
+  }
+
   async getConversations(): Promise<ConversationListItem[]> {
     return this.fetch<ConversationListItem[]>('/chat/history');
   }
 
+  async searchConversations(query: string, limit = 20, offset = 0): Promise<SearchResponse> {
+    const params = new URLSearchParams({ q: query, limit: String(limit), offset: String(offset) });
+    return this.fetch<SearchResponse>(`/chat/search?${params}`);
+  }
+
   async getConversation(id: number): Promise<Conversation> {
     return this.fetch<Conversation>(`/chat/${id}`);
   }
@@ -119,7 +161,15 @@ class ApiClient {
   async generateGraph(conversationId: number): Promise<{ graph_base64: string }> {
     return this.fetch(`/chat/${conversationId}/graph`, { method: 'POST' });
   }
+
+  // Poll while a message's graph_pending is true (graph finishing after the reply)
+  async getMessageGraph(
+    conversationId: number,
+    messageId: number,
+  ): Promise<{ status: 'pending' | 'ready' | 'none'; graph_path: string | null }> {
+    return this.fetch(`/chat/${conversationId}/messages/${messageId}/graph`);
+  }
 }
 
 export const api = new ApiClient();
-export type { Message, Conversation, ConversationListItem, ChatResponse, User };
+export type { Message, Conversation, ConversationListItem, SearchResult, SearchResponse, ChatResponse, User };
@@ -4,9 +4,19 @@ Executes matplotlib code and saves the output as an image.
 """
 
 import sys
+import uuid
 import subprocess
 from pathlib import Path
 from datetime import datetime
+from plot_validator import validate_plot_code
+from deadline import stage_timeout
+from graph_sweep import render_sweep
+
+RENDER_TIMEOUT = 15
+TIMEOUT_ERROR = "Timeout"  # prefix of every timeout error, e.g. "Timeout (15s)"
+
+# Below this there is no point starting the interpreter
+MIN_RENDER_SECONDS = 1
 
 
 class GraphRenderer:
@@ -32,23 +42,41 @@ class GraphRenderer:
         
         return '\n'.join(code_lines) if code_lines else ""
     
-    def render(self, code: str) -> tuple[str, str]:
+    def _new_image_path(self, prefix: str = "graph") -> Path:
+        # Unique per render: concurrent renders within the same second must not collide
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{uuid.uuid4().hex[:8]}"
+        return self.output_dir / f"{prefix}_{timestamp}.png"
+    
+    def render_sweep(self, code: str, animate: bool = False) -> tuple[str, str]:
+        """
+        Render a '# SWEEP:' template once per parameter value, in parallel, and
+        combine the panels into a grid PNG (or a GIF when animate is set).
+        """
+        return render_sweep(self.render, code, self._new_image_path(), animate=animate)
+    
+    def render(self, code: str, dpi: int = 150) -> tuple[str, str]:
         """
         Execute code and save graph image.
         Returns (image_path, None) on success or (None, error_message) on failure.
         """
-        if not code.strip():
-            return None, "No code to execute"
+        # Reject doomed code before paying for a subprocess (and maybe the full timeout)
+        code, error = validate_plot_code(code)
+        if error:
+            return None, error
+        
+        # Within a request deadline, only what's left of it
+        timeout = stage_timeout(RENDER_TIMEOUT)
+        if timeout < MIN_RENDER_SECONDS:
+            return None, f"{TIMEOUT_ERROR} (request deadline reached)"
         
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        img_path = self.output_dir / f"graph_{timestamp}.png"
-        code_path = self.output_dir / f"code_{timestamp}.py"
+        img_path = self._new_image_path()
+        code_path = img_path.with_name(img_path.stem.replace("graph_", "code_", 1) + ".py")
         
         # Prepare code with matplotlib backend and save command
         prepared = "import matplotlib\nmatplotlib.use('Agg')\n"
         prepared += "import matplotlib.pyplot as plt\nimport numpy as np\n\n"
         prepared += code.replace('plt.show()', '')
-        prepared += f"\nplt.tight_layout()\nplt.savefig(r'{img_path}', dpi=150, bbox_inches='tight')\nplt.close()"
+        prepared += f"\nplt.tight_layout()\nplt.savefig(r'{img_path}', dpi={dpi}, bbox_inches='tight')\nplt.close()"
         
         code_path.write_text(prepared, encoding='utf-8')
         
@@ -57,7 +85,7 @@ class GraphRenderer:
                 [sys.executable, str(code_path)],
                 capture_output=True,
                 text=True,
-                timeout=15
+                timeout=timeout
             )
             
             if result.returncode == 0 and img_path.exists():
@@ -65,6 +93,6 @@ class GraphRenderer:
             return None, result.stderr or "Unknown error"
             
         except subprocess.TimeoutExpired:
-            return None, "Timeout (15s)"
+            return None, f"{TIMEOUT_ERROR} ({timeout:.0f}s)"
         except Exception as e:
             return None, str(e)
@@ -0,0 +1,206 @@
+"""
+Graph Storage - where rendered graph images live and how they are served
+Every worker/replica must see the same images, so rendering publishes through
+a backend and /graph/{key} reads back through the same backend.
+
+GRAPH_STORAGE selects the backend:
+    auto        Firebase if configured, otherwise filesystem (default)
+    filesystem  GRAPH_STORAGE_DIR (default "outputs"); point it at a shared mount
+    database    image bytes in the graph_blobs table (object-store stand-in
+                that works wherever the database is shared)
+    firebase    Firebase Storage public URLs
+"""
+
+import os
+import logging
+import re
+import uuid
+import shutil
+import threading
+from pathlib import Path
+from typing import Iterator, Optional
+from database import SessionLocal, GraphBlob
+from firebase_utils import init_firebase, upload_graph, delete_graph
+
+logger = logging.getLogger(__name__)
+
+GRAPH_URL_PREFIX = "/graph/"
+CHUNK_SIZE = 64 * 1024
+
+# Renderer output names only; rejects path traversal and anything unexpected
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+\.(png|gif)$")
+
+MEDIA_TYPES = {".png": "image/png", ".gif": "image/gif"}
+
+
+def graph_key(graph_path: str) -> Optional[str]:
+    """Extract the storage key from a '/graph/<key>' path (None for URLs/invalid)."""
+    if not graph_path or not graph_path.startswith(GRAPH_URL_PREFIX):
+        return None
+    key = graph_path[len(GRAPH_URL_PREFIX):]
+    return key if _KEY_PATTERN.match(key) else None
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key))
+
+
+def media_type(key: str) -> str:
+    return MEDIA_TYPES.get(Path(key).suffix.lower(), "application/octet-stream")
+
+
+class FilesystemGraphStorage:
+    """Images in a directory; shared across nodes when the directory is a shared mount."""
+    name = "filesystem"
+
+    def __init__(self, directory: str = "outputs"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def save(self, img_path: str) -> str:
+        source = Path(img_path)
+        dest = self.directory / source.name
+        if source.resolve() != dest.resolve():
+            # Copy then rename so other nodes never see a half-written file
+            tmp = self.directory / f".{source.name}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, dest)
+            source.unlink(missing_ok=True)
+        return f"{GRAPH_URL_PREFIX}{dest.name}"
+
+    def open_stream(self, key: str) -> Optional[Iterator[bytes]]:
+        path = self.directory / key
+        try:
+            handle = open(path, "rb")
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+        def chunks():
+            with handle:
+                while chunk := handle.read(CHUNK_SIZE):
+                    yield chunk
+        return chunks()
+
+    def read_bytes(self, graph_path: str) -> Optional[bytes]:
+        key = graph_key(graph_path)
+        if not key:
+            return None
+        try:
+            return (self.directory / key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, graph_path: str):
+        key = graph_key(graph_path)
+        if key:
+            (self.directory / key).unlink(missing_ok=True)
+
+
+class DatabaseGraphStorage:
+    """
+    Images as blobs in the shared database; no shared disk needed.
+    Paths not found in the table are looked up in the fallback (pre-migration files).
+    """
+    name = "database"
+
+    def __init__(self, fallback: Optional[FilesystemGraphStorage] = None):
+        self.fallback = fallback
+
+    def save(self, img_path: str) -> str:
+        source = Path(img_path)
+        db = SessionLocal()
+        try:
+            db.add(GraphBlob(key=source.name, data=source.read_bytes()))
+            db.commit()
+        finally:
+            db.close()
+        source.unlink(missing_ok=True)
+        return f"{GRAPH_URL_PREFIX}{source.name}"
+
+    def open_stream(self, key: str) -> Optional[Iterator[bytes]]:
+        data = self._load(key)
+        if data is None:
+            return self.fallback.open_stream(key) if self.fallback else None
+        return (data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
+
+    def read_bytes(self, graph_path: str) -> Optional[bytes]:
+        key = graph_key(graph_path)
+        data = self._load(key) if key else None
+        if data is None and self.fallback:
+            return self.fallback.read_bytes(graph_path)
+        return data
+
+    def delete(self, graph_path: str):
+        key = graph_key(graph_path)
+        if not key:
+            return
+        db = SessionLocal()
+        try:
+            db.query(GraphBlob).filter(GraphBlob.key == key).delete()
+            db.commit()
+        finally:
+            db.close()
+        if self.fallback:
+            self.fallback.delete(graph_path)
+
+    def _load(self, key: str) -> Optional[bytes]:
+        db = SessionLocal()
+        try:
+            return db.query(GraphBlob.data).filter(GraphBlob.key == key).scalar()
+        finally:
+            db.close()
+
+
+class FirebaseGraphStorage:
+    """
+    Images uploaded to Firebase Storage and served from their public URL.
+    Legacy/fallback '/graph/' paths are handled by a filesystem store.
+    """
+    name = "firebase"
+
+    def __init__(self, fallback: FilesystemGraphStorage):
+        self.fallback = fallback
+
+    def save(self, img_path: str) -> str:
+        public_url = upload_graph(img_path)
+        if public_url:
+            Path(img_path).unlink(missing_ok=True)
+            return public_url
+        return self.fallback.save(img_path)
+
+    def open_stream(self, key: str) -> Optional[Iterator[bytes]]:
+        return self.fallback.open_stream(key)
+
+    def read_bytes(self, graph_path: str) -> Optional[bytes]:
+        # Public URLs are loaded by the client directly
+        return self.fallback.read_bytes(graph_path)
+
+    def delete(self, graph_path: str):
+        if graph_path.startswith("http"):
+            delete_graph(graph_path)
+        else:
+            self.fallback.delete(graph_path)
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_graph_storage():
+    """Backend selected by GRAPH_STORAGE, created on first use (Firebase init is lazy)."""
+    global _storage
+    if _storage is not None:
+        return _storage
+
+    with _storage_lock:
+        if _storage is None:
+            backend = os.getenv("GRAPH_STORAGE", "auto").lower()
+            filesystem = FilesystemGraphStorage(os.getenv("GRAPH_STORAGE_DIR", "outputs"))
+            if backend == "database":
+                _storage = DatabaseGraphStorage(fallback=filesystem)
+            elif backend == "firebase" or (backend == "auto" and init_firebase()):
+                _storage = FirebaseGraphStorage(filesystem)
+            else:
+                _storage = filesystem
+            logger.info("Graph storage backend: %s", _storage.name)
+    return _storage
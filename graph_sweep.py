@@ -0,0 +1,199 @@
+"""
+Graph Sweeps - one plotting template rendered across a parameter grid
+"Plot y = x^2 + kx + 1 for k = -3..3" becomes one panel per value of k,
+rendered in parallel (one isolated subprocess per panel, bounded by the
+CPU count) and assembled into a grid image or an animated GIF.
+
+The template's first line declares the grid:
+    # SWEEP: k = [-3, -2, -1, 0, 1, 2, 3]
+and the rest of the code uses k without assigning it. Code without that line
+is rendered as an ordinary single plot.
+"""
+
+import os
+import logging
+import re
+import ast
+import math
+import contextvars
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_PANELS = 12  # grid
+MAX_FRAMES = 24  # animation
+MAX_PARALLEL = max(1, min(os.cpu_count() or 1, 8))
+
+PANEL_DPI = 100  # panels are shown small, full 150 dpi only costs render time
+PANEL_MAX_WIDTH = 640
+FRAME_DURATION_MS = 400
+
+_SWEEP_LINE = re.compile(r"^\s*#\s*SWEEP:\s*([A-Za-z_]\w*)\s*=\s*(\[.*\])\s*$", re.MULTILINE)
+
+# A one-letter parameter that isn't the plot's own variable: "for x = -3 to 3"
+# is the domain of a single curve, "for k = -3..3" a family of curves
+_PARAM = r"(?!(?:x|y|z|t|θ)\b)[a-zα-ω]\b"
+
+# Problem phrasings that ask for a family of curves rather than one plot
+_SWEEP_REQUEST = re.compile(
+    rf"\bfor\s+{_PARAM}\s*(=|in|∈|from)\s*[\[{{(]?\s*-?\d"  # for k = -3..3, for a in {{1,2,3}}, for k from 1 to 5
+    rf"|\b{_PARAM}\s*(in|∈)\s*[\[{{]"  # k ∈ {{1, 2, 3}}
+    rf"|\b{_PARAM}\s*=\s*-?\d+(\.\d+)?\s*(\.\.|,\s*-?\d)"  # k = -3..3, k = 1, 2, 3
+    rf"|\b(different|various|several)\s+values\s+of\s+{_PARAM}"
+    rf"|\bas\s+{_PARAM}\s+(varies|changes|increases|decreases)\b"
+    r"|\banimat(e|ion)\b",
+    re.IGNORECASE
+)
+_ANIMATION_REQUEST = re.compile(r"\banimat(e|ion)\b|\bgif\b", re.IGNORECASE)
+
+
+def sweep_requested(problem: str) -> bool:
+    return bool(_SWEEP_REQUEST.search(problem))
+
+
+def animation_requested(problem: str) -> bool:
+    return bool(_ANIMATION_REQUEST.search(problem))
+
+
+def parse_sweep(code: str) -> Optional[tuple[str, list]]:
+    """(parameter, values) from the template's '# SWEEP:' line, or None if it has none."""
+    match = _SWEEP_LINE.search(code)
+    if not match:
+        return None
+    try:
+        values = ast.literal_eval(match.group(2))
+    except (ValueError, SyntaxError):
+        return None
+    if not isinstance(values, list) or not values:
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    return match.group(1), values
+
+
+def _limit(values: list, limit: int) -> list:
+    """Evenly subsample to at most `limit` values, keeping both ends."""
+    if len(values) <= limit:
+        return values
+    step = (len(values) - 1) / (limit - 1)
+    return [values[round(i * step)] for i in range(limit)]
+
+
+def panel_code(template: str, param: str, value) -> str:
+    return f"{param} = {value!r}\n" + _SWEEP_LINE.sub("", template)
+
+
+def render_panels(
+    render: Callable[..., tuple[Optional[str], Optional[str]]],
+    template: str,
+    param: str,
+    values: list
+) -> list[tuple[Optional[str], Optional[str]]]:
+    """Render every panel concurrently; results are in the order of values."""
+    with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL, len(values)), thread_name_prefix="sweep") as pool:
+        # Each panel carries the caller's context (request deadline, usage tracker)
+        futures = [
+            pool.submit(contextvars.copy_context().run, render, panel_code(template, param, value), PANEL_DPI)
+            for value in values
+        ]
+        return [future.result() for future in futures]
+
+
+def _load_panels(paths: list[str]):
+    from PIL import Image
+
+    panels = []
+    for path in paths:
+        with Image.open(path) as image:
+            panel = image.convert("RGB")
+        if panel.width > PANEL_MAX_WIDTH:
+            panel = panel.resize(
+                (PANEL_MAX_WIDTH, round(panel.height * PANEL_MAX_WIDTH / panel.width)),
+                Image.LANCZOS
+            )
+        panels.append(panel)
+    return panels
+
+
+def assemble_grid(paths: list[str], out_path: Path) -> str:
+    """Tile panels into a near-square grid PNG."""
+    from PIL import Image
+
+    panels = _load_panels(paths)
+    cols = math.ceil(math.sqrt(len(panels)))
+    rows = math.ceil(len(panels) / cols)
+    cell_w = max(p.width for p in panels)
+    cell_h = max(p.height for p in panels)
+
+    sheet = Image.new("RGB", (cols * cell_w, rows * cell_h), "white")
+    for i, panel in enumerate(panels):
+        row, col = divmod(i, cols)
+        # Centre each panel in its cell (tight bounding boxes differ slightly)
+        x = col * cell_w + (cell_w - panel.width) // 2
+        y = row * cell_h + (cell_h - panel.height) // 2
+        sheet.paste(panel, (x, y))
+    sheet.save(out_path, optimize=True)
+    return str(out_path)
+
+
+def assemble_animation(paths: list[str], out_path: Path) -> str:
+    """Loop the panels as frames of a palette GIF (small enough to inline)."""
+    from PIL import Image
+
+    panels = _load_panels(paths)
+    size = panels[0].size
+    frames = [
+        (p if p.size == size else p.resize(size, Image.LANCZOS)).quantize(colors=128)
+        for p in panels
+    ]
+    frames[0].save(
+        out_path,
+        save_all=True,
+        append_images=frames[1:],
+        duration=FRAME_DURATION_MS,
+        loop=0,
+        optimize=True
+    )
+    return str(out_path)
+
+
+def render_sweep(
+    render: Callable[..., tuple[Optional[str], Optional[str]]],
+    template: str,
+    out_path: Path,
+    animate: bool = False
+) -> tuple[Optional[str], Optional[str]]:
+    """
+    Render a '# SWEEP:' template and assemble the panels.
+    Returns (image_path, None), or (None, error) if the template is unusable
+    or no panel rendered. Panels that fail are left out of the result.
+    """
+    spec = parse_sweep(template)
+    if not spec:
+        return None, "Missing or invalid '# SWEEP: name = [values]' line"
+    param, values = spec
+    values = _limit(values, MAX_FRAMES if animate else MAX_PANELS)
+
+    results = render_panels(render, template, param, values)
+    paths = [path for path, _ in results if path]
+    errors = [f"{param} = {value!r}: {error}" for value, (path, error) in zip(values, results) if not path]
+
+    try:
+        if not paths:
+            return None, errors[0]
+        if errors:
+            logger.warning("Sweep: %d of %d panels failed, e.g. %s", len(errors), len(values), errors[0][:200])
+        if len(paths) == 1:
+            os.replace(paths[0], out_path.with_suffix(".png"))
+            return str(out_path.with_suffix(".png")), None
+        if animate:
+            return assemble_animation(paths, out_path.with_suffix(".gif")), None
+        return assemble_grid(paths, out_path.with_suffix(".png")), None
+    finally:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
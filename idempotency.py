@@ -0,0 +1,149 @@
+"""
+Idempotency Keys - safe client retries for POST endpoints
+The first request carrying an Idempotency-Key does the work and stores its
+response; duplicates (concurrent or later, on any worker) wait for it and
+get the stored response replayed instead of repeating the LLM calls.
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import IdempotencyKey
+from responses import fast_dumps
+
+MAX_KEY_LENGTH = 255
+KEY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+
+# A pending key this old belongs to a request that died; a retry may take it over
+PENDING_TIMEOUT = timedelta(minutes=5)
+
+# How long a duplicate waits for the original to finish before giving up (409)
+WAIT_SECONDS = 60
+POLL_INTERVAL = 0.25
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# _claim() result: this request inserted the key and must do the work
+CLAIMED = object()
+
+
+def request_fingerprint(*parts) -> str:
+    """Hash of the request content; a reused key must come with the same request."""
+    return hashlib.sha256(fast_dumps(jsonable_encoder(parts))).hexdigest()
+
+
+def _key_filter(user_id: int, scope: str, key: str):
+    return (
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.scope == scope,
+        IdempotencyKey.key == key,
+    )
+
+
+def _claim(db: Session, user_id: int, scope: str, key: str, request_hash: str):
+    """
+    Try to become the request that does the work.
+    Returns CLAIMED, the row of the request that owns the key, or None if
+    that row was released in between (claim again).
+    """
+    now = datetime.utcnow()
+    # Expired keys are dropped here, per user, so no cleanup job is needed
+    db.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.created_at < now - KEY_TTL
+    ))
+    db.execute(delete(IdempotencyKey).where(
+        *_key_filter(user_id, scope, key),
+        IdempotencyKey.status == "pending",
+        IdempotencyKey.created_at < now - PENDING_TIMEOUT
+    ))
+    db.add(IdempotencyKey(user_id=user_id, scope=scope, key=key, request_hash=request_hash))
+    try:
+        db.commit()
+        return CLAIMED
+    except IntegrityError:
+        db.rollback()
+    return _lookup(db, user_id, scope, key)
+
+
+def _lookup(db: Session, user_id: int, scope: str, key: str) -> Optional[IdempotencyKey]:
+    return db.query(IdempotencyKey).filter(*_key_filter(user_id, scope, key)).first()
+
+
+def _abandoned(row: IdempotencyKey) -> bool:
+    """A pending key whose request died (see PENDING_TIMEOUT); _claim will take it over."""
+    return row.status == "pending" and row.created_at < datetime.utcnow() - PENDING_TIMEOUT
+
+
+async def run_idempotent(
+    db: Session,
+    user_id: int,
+    scope: str,
+    key: str,
+    request_hash: str,
+    work: Callable[[], Any]
+):
+    """
+    Run work() (in the threadpool) at most once per (user, scope, key) within the TTL.
+    The first request gets work()'s result; duplicates get a Response replaying
+    the stored JSON with an Idempotent-Replayed header. Failed work releases
+    the key so the client can retry.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    deadline = time.monotonic() + WAIT_SECONDS
+    existing = await run_in_threadpool(_claim, db, user_id, scope, key, request_hash)
+    while existing is not CLAIMED:
+        if existing is not None:
+            if existing.request_hash != request_hash:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was already used for a different request"
+                )
+            if existing.status == "done":
+                return Response(
+                    content=existing.response_body,
+                    media_type="application/json",
+                    headers={REPLAYED_HEADER: "true"}
+                )
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still in progress"
+                )
+            # End the read transaction so the original request can commit
+            db.rollback()
+            await asyncio.sleep(POLL_INTERVAL)
+            # Wait with reads only; claim again once the owner released or abandoned the key
+            existing = await run_in_threadpool(_lookup, db, user_id, scope, key)
+            if existing is not None and not _abandoned(existing):
+                continue
+        existing = await run_in_threadpool(_claim, db, user_id, scope, key, request_hash)
+
+    try:
+        # Off the event loop, so duplicates on this worker can poll meanwhile
+        result = await run_in_threadpool(work)
+    except BaseException:
+        db.rollback()
+        db.execute(delete(IdempotencyKey).where(*_key_filter(user_id, scope, key)))
+        db.commit()
+        raise
+
+    db.execute(
+        update(IdempotencyKey)
+        .where(*_key_filter(user_id, scope, key))
+        .values(status="done", response_body=fast_dumps(jsonable_encoder(result)).decode("utf-8"))
+    )
+    db.commit()
+    return result
@@ -0,0 +1,220 @@
+"""
+Structured Logging - JSON logs that stay off the request path
+Log calls only put a record on an in-memory queue; a background thread
+(QueueListener) formats and writes it, so a slow stdout or log pipe never
+adds latency to a request. If the queue is full, records are dropped and
+counted rather than waiting.
+
+RequestContextMiddleware gives every request an ID (the client's
+X-Request-ID if valid, otherwise a new one), echoes it in the response,
+stamps it on every record logged while handling the request and writes one
+access record per request, sampled per route (LOG_SAMPLE_RATES).
+
+Env: LOG_LEVEL (INFO), LOG_FORMAT (json | text), LOG_SLOW_REQUEST_MS (2000),
+     LOG_SAMPLE_RATES, e.g. "/health=0,/graph/=0.1" (longest prefix wins;
+     errors and slow requests are always logged)
+"""
+
+import os
+import re
+import sys
+import copy
+import json
+import time
+import uuid
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+QUEUE_SIZE = 10000
+SLOW_REQUEST_MS = float(os.getenv("LOG_SLOW_REQUEST_MS", "2000"))
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+# (except uvicorn's color_message, an ANSI copy of msg)
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "request_id", "color_message"}
+
+_request_id: ContextVar = ContextVar("request_id", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+_dropped = 0
+
+access_logger = logging.getLogger("access")
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request_id, extra fields, exc."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", "-") != "-":
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if _dropped:
+            entry["logs_dropped"] = _dropped
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Never blocks: captures caller state now, formats later on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = _request_id.get() or "-"
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """Route all logging (including uvicorn's) through the queue. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+
+    output = logging.StreamHandler(sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [_QueueHandler(log_queue)]
+    root.setLevel(level)
+
+    # uvicorn installs its own stdout handlers; send its records through ours.
+    # Its access log is replaced by RequestContextMiddleware's (with request IDs).
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)  # flush what's queued on shutdown
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """'/health=0,/graph/=0.1' -> {'/health': 0.0, '/graph/': 0.1}; bad entries ignored."""
+    rates = {}
+    for part in value.split(","):
+        prefix, _, rate = part.partition("=")
+        try:
+            rates[prefix.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware: request ID correlation and sampled access logging.
+    Outermost in the stack so its timing covers every other middleware.
+    """
+
+    def __init__(self, app, sample_rates: Optional[dict[str, float]] = None):
+        self.app = app
+        if sample_rates is None:
+            sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+        # Longest prefix first so "/health/ready" can differ from "/health"
+        self.sample_rates = sorted(sample_rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def sample_rate(self, path: str) -> float:
+        for prefix, rate in self.sample_rates:
+            if path.startswith(prefix):
+                return rate
+        return 1.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        incoming = headers.get(REQUEST_ID_HEADER.lower().encode(), b"").decode("latin-1")
+        request_id = incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        token = _request_id.set(request_id)
+
+        started = time.perf_counter()
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {
+                    **message,
+                    "headers": list(message.get("headers", [])) + [
+                        (REQUEST_ID_HEADER.lower().encode(), request_id.encode())
+                    ]
+                }
+            elif message["type"] == "websocket.accept":
+                status = 101
+            elif message["type"] == "websocket.close" and status is None:
+                status = 403  # rejected before the handshake completed
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            logging.getLogger(__name__).exception("Unhandled error in %s %s", scope.get("method", "WS"), scope["path"])
+            raise
+        finally:
+            self._log_access(scope, status, (time.perf_counter() - started) * 1000)
+            _request_id.reset(token)
+
+    def _log_access(self, scope, status: Optional[int], duration_ms: float):
+        path = scope["path"]
+        always = (status or 0) >= 400 or duration_ms >= SLOW_REQUEST_MS
+        if not always:
+            rate = self.sample_rate(path)
+            if rate <= 0 or (rate < 1 and random.random() >= rate):
+                return
+
+        route = scope.get("route")
+        access_logger.info(
+            "%s %s %s %.0fms", scope.get("method", "WS"), path, status, duration_ms,
+            extra={
+                "method": scope.get("method", "WS"),
+                "path": path,
+                "route": getattr(route, "path", None),
+                "status": status,
+                "duration_ms": round(duration_ms, 1),
+                "slow": duration_ms >= SLOW_REQUEST_MS,
+            }
+        )
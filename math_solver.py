@@ -4,7 +4,17 @@ Token-efficient, LaTeX-formatted solutions using Groq API.
 """
 
 import os
-from openai import OpenAI
+import time
+import hashlib
+import threading
+from typing import Callable, Optional
+from usage import record_llm_call
+from deadline import DeadlineExceeded, stage_timeout, deadline_exceeded, time_left, run_within_deadline
+
+# Per-call limit; inside a request deadline the remaining budget applies if shorter
+LLM_TIMEOUT = 60
+# Most of a call's budget is waiting for the answer; setting up the connection gets a small slice
+CONNECT_TIMEOUT = 5
 
 
 MATH_SYSTEM_PROMPT = """You are a JEE/Olympiad math expert. Provide CONCISE step-by-step solutions.
@@ -21,6 +31,27 @@ GRAPH_ONLY_PROMPT = """Generate ONLY Python matplotlib code to visualize the giv
 No explanations, just working Python code in a ```python block.
 Use numpy for calculations. Include proper labels and title."""
 
+GRAPH_SWEEP_PROMPT = """Generate Python matplotlib code for ONE panel of a parameter sweep.
+The first line declares the values of the parameter that varies between
+curves (at most 12), e.g.:
+# SWEEP: k = [-3, -2, -1, 0, 1, 2, 3]
+The code runs once per value with the parameter already set; never assign it.
+Never sweep the plotted variable (x, t, ...): its range is the axis of every panel.
+If the problem really asks for one curve, omit the SWEEP line and write an
+ordinary plot instead.
+Draw a single plot, show the parameter value in the title and use fixed axis
+limits so the panels are comparable. Use numpy for calculations.
+No explanations, just working Python code in a ```python block."""
+
+TRUNCATED_NOTE = "\n\n_(Solution cut short: time limit reached. Ask me to continue.)_"
+# Reply when the deadline is spent before any of the solution arrived
+DEADLINE_NOTE = "_(Ran out of time before I could work on this one. Please ask again.)_"
+
+GRAPH_REPAIR_PROMPT = """The matplotlib code below failed. Return a corrected version.
+Keep the same plot, fix only what the error points to. Keep any '# SWEEP:' first line.
+Only numpy, matplotlib and math are available; no input(), files or plt.show().
+No explanations, just working Python code in a ```python block."""
+
 
 class MathSolver:
     """Math solver using Groq API."""
@@ -30,40 +61,163 @@ class MathSolver:
         if not api_key:
             raise ValueError("GROQ_API_KEY not found")
         
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://api.groq.com/openai/v1"
-        )
+        self.api_key = api_key
         self.model = "llama-3.3-70b-versatile"
+        self._client = None
+        self._client_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        """OpenAI client, created on first use (importing openai is slow)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url="https://api.groq.com/openai/v1"
+                    )
+        return self._client
+    
+    @property
+    def is_warm(self) -> bool:
+        return self._client is not None
     
-    def solve(self, problem: str) -> str:
-        """Get concise LaTeX-formatted solution."""
+    @property
+    def cache_version(self) -> str:
+        """Changes whenever the model or a prompt changes, invalidating cached answers."""
+        fingerprint = "|".join((self.model, MATH_SYSTEM_PROMPT, GRAPH_ONLY_PROMPT, GRAPH_SWEEP_PROMPT))
+        return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    
+    def _api(self):
+        """
+        Client for the next call. Inside a request deadline it never retries:
+        the SDK's default 2 retries would run the call up to 3 times the budget.
+        """
+        if time_left() is None:
+            return self.client
+        return self.client.with_options(max_retries=0)
+    
+    def _timeout(self):
+        """
+        Timeout for the next upstream call; fails fast once the request deadline is spent.
+        httpx limits each phase (pool, connect, write, read) separately, so the
+        budget is split between them; a call abandoned by run_within_deadline
+        then ends near the deadline too instead of holding its thread.
+        """
+        import httpx
+        
+        total = stage_timeout(LLM_TIMEOUT)
+        if total <= 0:
+            raise DeadlineExceeded("Request deadline exceeded")
+        setup = min(CONNECT_TIMEOUT, total / 10)
+        return httpx.Timeout(total - 3 * setup, connect=setup, write=setup, pool=setup)
+    
+    def solve(self, problem: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Get concise LaTeX-formatted solution.
+        If on_token is given the response is streamed and each delta passed to it.
+        """
         try:
-            response = self.client.chat.completions.create(
+            started = time.perf_counter()
+            streaming = on_token is not None
+            response = run_within_deadline(
+                self._api().chat.completions.create,
                 model=self.model,
                 messages=[
                     {"role": "system", "content": MATH_SYSTEM_PROMPT},
                     {"role": "user", "content": problem}
                 ],
                 temperature=0.3,
-                max_tokens=1500
+                max_tokens=1500,
+                timeout=self._timeout(),
+                stream=streaming,
+                # Streams only report token usage in a final chunk when asked to
+                **({"stream_options": {"include_usage": True}} if streaming else {})
             )
-            return response.choices[0].message.content
+            if not streaming:
+                record_llm_call("solve", self.model, response.usage, started)
+                return response.choices[0].message.content
+            
+            parts = []
+            stop = threading.Event()
+            try:
+                usage, truncated = run_within_deadline(self._read_stream, response, parts, on_token, stop)
+            except DeadlineExceeded:
+                # Stalled mid-stream; the reader gives up at its next chunk
+                stop.set()
+                parts = list(parts)
+                usage, truncated = None, True
+            if truncated:
+                # Out of time: keep what has streamed so far rather than nothing
+                parts.append(TRUNCATED_NOTE)
+                on_token(TRUNCATED_NOTE)
+            record_llm_call("solve", self.model, usage, started)
+            return "".join(parts)
+        except DeadlineExceeded:
+            # Nothing arrived in time: answer with a note, not an error string for the history
+            if on_token:
+                on_token(DEADLINE_NOTE)
+            return DEADLINE_NOTE
         except Exception as e:
             return f"Error: {str(e)}"
     
-    def generate_graph_code(self, problem: str) -> str:
-        """Generate only matplotlib code for the problem."""
+    def _read_stream(self, response, parts: list[str], on_token: Callable[[str], None], stop: threading.Event):
+        """Collect deltas into parts until the stream ends or time runs out. Returns (usage, truncated)."""
+        usage = None
         try:
-            response = self.client.chat.completions.create(
+            for chunk in response:
+                if stop.is_set():
+                    return usage, True
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_token(delta)
+                if deadline_exceeded():
+                    return usage, True
+            return usage, False
+        finally:
+            response.close()
+    
+    def generate_graph_code(self, problem: str, sweep: bool = False) -> str:
+        """Generate only matplotlib code for the problem (a sweep template if sweep is set)."""
+        try:
+            started = time.perf_counter()
+            response = run_within_deadline(
+                self._api().chat.completions.create,
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": GRAPH_ONLY_PROMPT},
+                    {"role": "system", "content": GRAPH_SWEEP_PROMPT if sweep else GRAPH_ONLY_PROMPT},
                     {"role": "user", "content": problem}
                 ],
                 temperature=0.2,
-                max_tokens=800
+                max_tokens=800,
+                timeout=self._timeout()
+            )
+            record_llm_call("graph_code", self.model, response.usage, started)
+            return response.choices[0].message.content
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    def repair_graph_code(self, problem: str, code: str, error: str) -> str:
+        """Ask once for a fix of plotting code that failed validation or rendering."""
+        try:
+            started = time.perf_counter()
+            response = run_within_deadline(
+                self._api().chat.completions.create,
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": GRAPH_REPAIR_PROMPT},
+                    {"role": "user", "content": (
+                        f"Problem: {problem}\n\n```python\n{code}\n```\n\nError:\n{error}"
+                    )}
+                ],
+                temperature=0.1,
+                max_tokens=800,
+                timeout=self._timeout()
             )
+            record_llm_call("graph_repair", self.model, response.usage, started)
             return response.choices[0].message.content
         except Exception as e:
             return f"Error: {str(e)}"
@@ -46,6 +46,7 @@ class MessageResponse(BaseModel):
     content: str
     has_graph: bool
     graph_path: Optional[str]
+    graph_pending: bool = False  # still rendering; poll /chat/{id}/messages/{message_id}/graph
     created_at: datetime
     
     class Config:
@@ -73,6 +74,40 @@ class ConversationListItem(BaseModel):
         from_attributes = True
 
 
+class SearchResult(BaseModel):
+    conversation_id: int
+    conversation_title: str
+    message_id: Optional[int]  # None for title matches
+    role: Optional[str]
+    snippet: str
+    created_at: datetime
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: list[SearchResult] = []
+    limit: int
+    offset: int
+    has_more: bool = False
+
+
+class ImportResponse(BaseModel):
+    conversations: int
+    messages: int
+
+
+class UsageReportRow(BaseModel):
+    key: str  # user email, day (YYYY-MM-DD) or model name
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    cached_tokens: int
+    avg_latency_ms: int
+    max_latency_ms: Optional[int]
+    cache_hits: int
+
+
 class ChatResponse(BaseModel):
     message: MessageResponse
     conversation_id: int
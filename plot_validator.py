@@ -0,0 +1,335 @@
+"""
+Plot Code Validator - static checks on generated matplotlib code
+Runs before GraphRenderer spawns a subprocess, so code that cannot work
+(syntax errors, blocked calls, unbounded loops, huge arrays) fails in
+microseconds instead of after the render timeout.
+
+Small problems are repaired instead of rejected: plt.show()/savefig()
+calls are dropped, missing np/plt/math imports are added and oversized
+linspace() resolutions are clamped.
+"""
+
+import ast
+import math
+import importlib.util
+from functools import lru_cache
+from typing import Optional
+
+MAX_ARRAY_POINTS = 1_000_000
+MAX_LOOP_ITERATIONS = 1_000_000
+
+ALLOWED_MODULES = {
+    "numpy", "matplotlib", "mpl_toolkits", "math", "cmath", "fractions",
+    "decimal", "itertools", "functools", "random", "statistics", "scipy", "sympy",
+}
+
+BLOCKED_CALLS = {
+    "input", "open", "exec", "eval", "compile", "__import__",
+    "exit", "quit", "breakpoint", "help",
+}
+
+# Attribute calls that block, touch files or wait for a user
+BLOCKED_METHODS = {
+    "pause", "ginput", "waitforbuttonpress",
+    "load", "loadtxt", "genfromtxt", "fromfile", "save", "savez", "savetxt", "tofile",
+}
+
+# Statements dropped during repair; the renderer adds its own savefig()
+DROPPED_METHODS = {"show", "savefig", "close"}
+
+KNOWN_IMPORTS = {
+    "np": "import numpy as np",
+    "plt": "import matplotlib.pyplot as plt",
+    "math": "import math",
+}
+
+# num is the third positional argument of each
+SPACED_FUNCTIONS = {"linspace", "logspace", "geomspace"}
+SHAPED_FUNCTIONS = {"zeros", "ones", "empty", "full", "random", "normal", "uniform", "randint"}
+DIMENSION_FUNCTIONS = {"rand", "randn"}
+
+
+class PlotCodeError(ValueError):
+    """Generated code that must not be rendered."""
+
+
+@lru_cache(maxsize=None)
+def _module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def _call_name(node: ast.Call) -> Optional[str]:
+    if isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node.func, ast.Attribute):
+        return node.func.attr
+    return None
+
+
+class _Checker(ast.NodeTransformer):
+    """Walks the tree once: rejects with PlotCodeError, repairs in place."""
+
+    def __init__(self):
+        self.constants: dict[str, float] = {}  # NAME = <number>
+        self.array_sizes: dict[str, float] = {}  # x = np.linspace(..., n)
+        self.loop_factor = 1
+        self.bound_names: set[str] = set()
+        self.used_names: set[str] = set()
+
+    # ---------- Constant folding ----------
+
+    def const(self, node) -> Optional[float]:
+        """Numeric value of a constant expression, or None if unknown."""
+        if isinstance(node, ast.Constant):
+            is_number = isinstance(node.value, (int, float)) and not isinstance(node.value, bool)
+            return node.value if is_number else None
+        if isinstance(node, ast.Name):
+            return self.constants.get(node.id)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            value = self.const(node.operand)
+            if value is None:
+                return None
+            return -value if isinstance(node.op, ast.USub) else value
+        if isinstance(node, ast.BinOp):
+            left, right = self.const(node.left), self.const(node.right)
+            if left is None or right is None:
+                return None
+            try:
+                if isinstance(node.op, ast.Add):
+                    return left + right
+                if isinstance(node.op, ast.Sub):
+                    return left - right
+                if isinstance(node.op, ast.Mult):
+                    return left * right
+                if isinstance(node.op, ast.Div):
+                    return left / right
+                if isinstance(node.op, ast.FloorDiv):
+                    return left // right
+                if isinstance(node.op, ast.Pow) and abs(right) <= 64:
+                    return left ** right
+            except (ZeroDivisionError, OverflowError):
+                return None
+        return None
+
+    def shape_size(self, node) -> Optional[float]:
+        if isinstance(node, (ast.Tuple, ast.List)):
+            sizes = [self.const(e) for e in node.elts]
+            return math.prod(sizes) if None not in sizes else None
+        return self.const(node)
+
+    # ---------- Statements ----------
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.check_module(alias.name)
+            self.bound_names.add((alias.asname or alias.name).split(".")[0])
+        return node
+
+    def visit_ImportFrom(self, node):
+        self.check_module(node.module or "")
+        for alias in node.names:
+            self.bound_names.add(alias.asname or alias.name)
+        return node
+
+    def check_module(self, name: str):
+        root = name.split(".")[0]
+        if root not in ALLOWED_MODULES:
+            raise PlotCodeError(f"Import of '{name}' is not allowed; use numpy, matplotlib or math")
+        if not _module_available(root):
+            raise PlotCodeError(f"Module '{root}' is not installed; use numpy, matplotlib or math")
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        for target in node.targets:
+            if not isinstance(target, ast.Name):
+                continue
+            value = self.const(node.value)
+            if value is not None:
+                self.constants[target.id] = value
+            else:
+                self.constants.pop(target.id, None)
+            size = self.call_size(node.value)
+            if size is not None:
+                self.array_sizes[target.id] = size
+        return node
+
+    def visit_Expr(self, node):
+        # Bare plt.show() / plt.savefig(...) / plt.close() calls; Pass keeps blocks non-empty
+        call = node.value
+        if isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute):
+            if call.func.attr in DROPPED_METHODS:
+                return ast.copy_location(ast.Pass(), node)
+        self.generic_visit(node)
+        return node
+
+    def visit_While(self, node):
+        test = node.test
+        always_true = isinstance(test, ast.Constant) and bool(test.value)
+        if always_true and not self.has_break(node.body):
+            raise PlotCodeError("Infinite loop: 'while True' without a break")
+        return self.visit_loop(node, None)
+
+    def visit_For(self, node):
+        iterations = None
+        if isinstance(node.iter, ast.Call) and _call_name(node.iter) == "range":
+            args = [self.const(a) for a in node.iter.args]
+            if args and None not in args:
+                start, stop, step = (0, args[0], 1) if len(args) == 1 else (args + [1])[:3]
+                if step:
+                    iterations = max(0, math.ceil((stop - start) / step))
+        elif isinstance(node.iter, ast.Name):
+            iterations = self.array_sizes.get(node.iter.id)
+        return self.visit_loop(node, iterations)
+
+    def visit_loop(self, node, iterations: Optional[float]):
+        outer = self.loop_factor
+        if iterations:
+            self.loop_factor = outer * iterations
+            if self.loop_factor > MAX_LOOP_ITERATIONS:
+                raise PlotCodeError(
+                    f"Loop runs about {int(self.loop_factor):,} times; keep it under "
+                    f"{MAX_LOOP_ITERATIONS:,} and prefer numpy vector operations"
+                )
+        try:
+            self.generic_visit(node)
+        finally:
+            self.loop_factor = outer
+        return node
+
+    def has_break(self, body, nested_loop: bool = False) -> bool:
+        """Whether anything in body leaves the enclosing loop."""
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)):
+                continue  # defined here, not run here
+            if isinstance(node, ast.Break) and not nested_loop:
+                return True
+            if isinstance(node, ast.Return):
+                return True
+            if isinstance(node, ast.Call) and _call_name(node) in ("exit", "quit"):
+                return True
+            if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+                # A break in an inner loop's body only ends that loop; its else: is still ours
+                if self.has_break(node.body, nested_loop=True):
+                    return True
+                children = [child for child in ast.iter_child_nodes(node) if child not in node.body]
+            else:
+                children = list(ast.iter_child_nodes(node))
+            if self.has_break(children, nested_loop):
+                return True
+        return False
+
+    def visit_FunctionDef(self, node):
+        self.bound_names.add(node.name)
+        for arg in node.args.args + node.args.kwonlyargs:
+            self.bound_names.add(arg.arg)
+        self.generic_visit(node)
+        return node
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    # ---------- Expressions ----------
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Store):
+            self.bound_names.add(node.id)
+        else:
+            self.used_names.add(node.id)
+        return node
+
+    def visit_Attribute(self, node):
+        if node.attr.startswith("__"):
+            raise PlotCodeError(f"Access to '{node.attr}' is not allowed")
+        self.generic_visit(node)
+        return node
+
+    def visit_Call(self, node):
+        name = _call_name(node)
+        if isinstance(node.func, ast.Name) and name in BLOCKED_CALLS:
+            raise PlotCodeError(f"Call to '{name}()' is not allowed")
+        if isinstance(node.func, ast.Attribute) and name in BLOCKED_METHODS:
+            raise PlotCodeError(f"Call to '.{name}()' is not allowed")
+
+        if name in SPACED_FUNCTIONS:
+            self.clamp_points(node)
+        size = self.call_size(node)
+        if size is not None and size > MAX_ARRAY_POINTS:
+            raise PlotCodeError(
+                f"{name}() creates about {int(size):,} elements; keep arrays under {MAX_ARRAY_POINTS:,}"
+            )
+        self.generic_visit(node)
+        return node
+
+    def clamp_points(self, node: ast.Call):
+        """Oversized plot resolution is harmless to reduce, so repair it."""
+        if len(node.args) >= 3:
+            num = self.const(node.args[2])
+            if num is not None and num > MAX_ARRAY_POINTS:
+                node.args[2] = ast.Constant(MAX_ARRAY_POINTS)
+        for keyword in node.keywords:
+            if keyword.arg == "num":
+                num = self.const(keyword.value)
+                if num is not None and num > MAX_ARRAY_POINTS:
+                    keyword.value = ast.Constant(MAX_ARRAY_POINTS)
+
+    def call_size(self, node) -> Optional[float]:
+        """Number of elements a numpy constructor call produces, if known."""
+        if not isinstance(node, ast.Call):
+            return None
+        name = _call_name(node)
+        keywords = {k.arg: k.value for k in node.keywords if k.arg}
+
+        if name in SPACED_FUNCTIONS:
+            num = node.args[2] if len(node.args) >= 3 else keywords.get("num")
+            return 50 if num is None else self.const(num)  # numpy's default num
+        if name == "arange":
+            args = [self.const(a) for a in node.args]
+            if not args or None in args:
+                return None
+            start, stop, step = (0, args[0], 1) if len(args) == 1 else (args + [1])[:3]
+            return max(0, math.ceil((stop - start) / step)) if step else None
+        if name in SHAPED_FUNCTIONS:
+            shape = keywords.get("size") or keywords.get("shape")
+            if shape is None and name in ("zeros", "ones", "empty", "full") and node.args:
+                shape = node.args[0]
+            return self.shape_size(shape) if shape is not None else None
+        if name in DIMENSION_FUNCTIONS and node.args:
+            sizes = [self.const(a) for a in node.args]
+            return math.prod(sizes) if None not in sizes else None
+        if name == "meshgrid":
+            sizes = [
+                self.array_sizes.get(a.id) if isinstance(a, ast.Name) else self.call_size(a)
+                for a in node.args
+            ]
+            return math.prod(sizes) if sizes and None not in sizes else None
+        return None
+
+
+def validate_plot_code(code: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    Check (and lightly repair) plotting code before it is rendered.
+    Returns (code, None) when it may run or (None, error_message) when it must not;
+    the error message is written to be fed back to the model for a repair.
+    """
+    if not code or not code.strip():
+        return None, "No code to execute"
+
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return None, f"SyntaxError: {e.msg} (line {e.lineno})"
+
+    checker = _Checker()
+    try:
+        tree = checker.visit(tree)
+    except PlotCodeError as e:
+        return None, str(e)
+    except RecursionError:
+        return None, "Code is too deeply nested"
+
+    # Names like np/plt used without their import
+    missing = [
+        KNOWN_IMPORTS[name] for name in KNOWN_IMPORTS
+        if name in checker.used_names and name not in checker.bound_names
+    ]
+    body = "\n".join(missing + [ast.unparse(ast.fix_missing_locations(tree))])
+    return body, None
@@ -0,0 +1,243 @@
+"""
+Fast Responses - orjson serialization and negotiated compression
+FastJSONResponse serializes trusted dicts directly (no Pydantic validation);
+CompressionMiddleware applies brotli or gzip to large bodies, including streams.
+ETag/Last-Modified helpers implement conditional GET (304 Not Modified).
+"""
+
+import json
+import time
+import zlib
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Optional
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # good ratio at interactive speeds (11 is far too slow per request)
+
+# A flush ends the compressor's block; flushing every small streamed chunk
+# (e.g. NDJSON rows) would cost most of the compression, so flush at most
+# every this many input bytes or seconds
+STREAM_FLUSH_BYTES = 64 * 1024
+STREAM_FLUSH_SECONDS = 1.0
+
+# Already-compressed payloads gain nothing from another pass
+SKIP_CONTENT_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip")
+
+
+def fast_dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes; datetimes become ISO 8601 strings."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=lambda o: o.isoformat(), ensure_ascii=False).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response for data already shaped by the route (skips response_model validation)."""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return fast_dumps(content)
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from cheap version markers (ids, counts, timestamps)."""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _http_date(value: datetime) -> str:
+    # Stored timestamps are naive UTC
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime] = None) -> dict:
+    """Headers that let clients revalidate instead of refetching."""
+    headers = {
+        "ETag": etag,
+        # Per-user data: browsers may store it but must revalidate every time
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime] = None) -> bool:
+    """
+    Evaluate If-None-Match (weak comparison) or, if absent, If-Modified-Since.
+    If-None-Match takes precedence as required by RFC 9110.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        if if_none_match.strip() == "*":
+            return True
+        ours = etag.removeprefix("W/")
+        return any(
+            tag.strip().removeprefix("W/") == ours
+            for tag in if_none_match.split(",")
+        )
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+    return False
+
+
+def not_modified_response(headers: dict) -> Response:
+    return Response(status_code=304, headers=headers)
+
+
+def _choose_encoding(accept_encoding: str) -> str | None:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        if "q=" in params:
+            try:
+                quality = float(params.split("q=", 1)[1])
+            except ValueError:
+                pass
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compressed output so far; may be empty until the next flush."""
+        self._unflushed += len(data)
+        flush = final or (
+            self._unflushed >= STREAM_FLUSH_BYTES
+            or time.monotonic() - self._last_flush >= STREAM_FLUSH_SECONDS
+        )
+        if flush:
+            self._unflushed = 0
+            self._last_flush = time.monotonic()
+
+        if self.encoding == "br":
+            out = self._br.process(data)
+            if final:
+                return out + self._br.finish()
+            return out + self._br.flush() if flush else out
+        out = self._gz.compress(data)
+        if final:
+            return out + self._gz.flush(zlib.Z_FINISH)
+        return out + self._gz.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware: compress HTTP responses of at least minimum_size bytes
+    with brotli (if installed and accepted) or gzip. Streaming bodies are
+    compressed as they arrive and flushed every STREAM_FLUSH_BYTES or
+    STREAM_FLUSH_SECONDS, so clients still see progress.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = _choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+
+            if message["type"] == "http.response.start":
+                response_headers = dict(message.get("headers") or [])
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                passthrough = (
+                    b"content-encoding" in response_headers
+                    or content_type.startswith(SKIP_CONTENT_TYPES)
+                    or message["status"] in (204, 206, 304)
+                )
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message  # held until the first body chunk
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if start_message is not None:
+                # First body chunk decides whether to compress at all
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start_message)
+                    start_message = None
+                    passthrough = True
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding)
+                response_headers = [
+                    (k, v) for k, v in start_message.get("headers", [])
+                    if k.lower() not in (b"content-length", b"content-encoding")
+                ]
+                body = compressor.compress(body, final=not more_body)
+                response_headers.append((b"content-encoding", encoding.encode()))
+                response_headers.append((b"vary", b"Accept-Encoding"))
+                if not more_body:
+                    response_headers.append((b"content-length", str(len(body)).encode()))
+                await send({**start_message, "headers": response_headers})
+                start_message = None
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+                return
+
+            body = compressor.compress(body, final=not more_body)
+            if body or not more_body:
+                await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,228 @@
+"""
+Retention - Expire old conversations in bounded batches
+Policies (all optional, configured via env, 0/unset disables):
+    RETENTION_MAX_AGE_DAYS              conversations not updated in N days
+    RETENTION_MAX_CONVERSATIONS_PER_USER keep only the newest N per user
+    RETENTION_INACTIVE_USER_DAYS        conversations of users not seen in N days
+Each batch is its own short transaction so writers are never locked out for long.
+Run once from the command line with: python retention.py (always vacuums, and
+converts a database created before auto_vacuum with a one-off full VACUUM)
+"""
+
+from dotenv import load_dotenv
+load_dotenv()  # DATABASE_URL must be set before database is imported
+
+import os
+import logging
+import time
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.orm import Session
+from database import SessionLocal, engine, User, Conversation, Message, SolutionCacheEntry
+from graph_storage import get_graph_storage
+
+logger = logging.getLogger(__name__)
+
+# Pause between batches so queued request writes can grab the lock
+BATCH_PAUSE_SECONDS = 0.05
+VACUUM_PAGES = 2000
+
+
+def _env_number(name: str, cast=int) -> Optional[float]:
+    value = os.getenv(name)
+    if not value:
+        return None
+    number = cast(value)
+    return number if number > 0 else None
+
+
+class RetentionPolicy:
+    """Retention limits; a limit of None disables that rule."""
+
+    def __init__(
+        self,
+        max_age_days: Optional[int] = None,
+        max_conversations_per_user: Optional[int] = None,
+        inactive_user_days: Optional[int] = None,
+        batch_size: int = 500,
+        interval_hours: float = 24.0
+    ):
+        self.max_age_days = max_age_days
+        self.max_conversations_per_user = max_conversations_per_user
+        self.inactive_user_days = inactive_user_days
+        self.batch_size = batch_size
+        self.interval_hours = interval_hours
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            max_age_days=_env_number("RETENTION_MAX_AGE_DAYS"),
+            max_conversations_per_user=_env_number("RETENTION_MAX_CONVERSATIONS_PER_USER"),
+            inactive_user_days=_env_number("RETENTION_INACTIVE_USER_DAYS"),
+            batch_size=_env_number("RETENTION_BATCH_SIZE") or 500,
+            interval_hours=_env_number("RETENTION_INTERVAL_HOURS", float) or 24.0,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return any((
+            self.max_age_days,
+            self.max_conversations_per_user,
+            self.inactive_user_days,
+        ))
+
+    def rules(self) -> dict:
+        """Map rule name -> select() of conversation ids to purge."""
+        now = datetime.utcnow()
+        rules = {}
+
+        if self.max_age_days:
+            cutoff = now - timedelta(days=self.max_age_days)
+            rules["age"] = select(Conversation.id).where(Conversation.updated_at < cutoff)
+
+        if self.inactive_user_days:
+            cutoff = now - timedelta(days=self.inactive_user_days)
+            rules["inactive_users"] = (
+                select(Conversation.id)
+                .join(User, User.id == Conversation.user_id)
+                .where(User.last_login < cutoff)
+            )
+
+        if self.max_conversations_per_user:
+            ranked = select(
+                Conversation.id,
+                func.row_number().over(
+                    partition_by=Conversation.user_id,
+                    order_by=Conversation.updated_at.desc()
+                ).label("rank")
+            ).subquery()
+            rules["quota"] = (
+                select(ranked.c.id)
+                .where(ranked.c.rank > self.max_conversations_per_user)
+            )
+
+        return rules
+
+
+def remove_graph_files(graph_paths: list[str]):
+    """Delete graph images referenced by purged messages from graph storage."""
+    storage = get_graph_storage()
+    for graph_path in graph_paths:
+        if not graph_path:
+            continue
+        try:
+            storage.delete(graph_path)
+        except Exception as e:
+            logger.warning("Failed to remove graph %s: %s", graph_path, e)
+
+
+def purge_conversations(db: Session, conversation_ids: list[int]) -> int:
+    """Delete conversations, their messages and graph files in one transaction."""
+    if not conversation_ids:
+        return 0
+
+    # A graph can be shown by several messages (solution cache hits, re-imported
+    # exports); only delete images nothing outside this purge still references
+    graph_paths = db.execute(
+        select(Message.graph_path).where(
+            Message.conversation_id.in_(conversation_ids),
+            Message.graph_path.isnot(None),
+            Message.graph_path.notin_(
+                select(SolutionCacheEntry.graph_path).where(SolutionCacheEntry.graph_path.isnot(None))
+            ),
+            Message.graph_path.notin_(
+                select(Message.graph_path).where(
+                    Message.conversation_id.notin_(conversation_ids),
+                    Message.graph_path.isnot(None)
+                )
+            )
+        ).distinct()
+    ).scalars().all()
+
+    db.execute(delete(Message).where(Message.conversation_id.in_(conversation_ids)))
+    db.execute(delete(Conversation).where(Conversation.id.in_(conversation_ids)))
+    db.commit()
+
+    # Images go only after the rows are gone, so a failed commit never orphans rows
+    remove_graph_files(graph_paths)
+    return len(conversation_ids)
+
+
+def vacuum(convert: bool = False):
+    """
+    Reclaim free pages and refresh planner statistics.
+    convert: rebuild a SQLite database created before auto_vacuum was set (a
+    full VACUUM, holding the write lock throughout; only the CLI passes it).
+    """
+    if engine.dialect.name == "sqlite":
+        raw = engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 0:
+                # The mode only takes effect after a full rebuild, which also
+                # reclaims what's free today; incremental_vacuum is a no-op until then
+                if convert:
+                    logger.info("Converting database to incremental auto_vacuum (one-off full VACUUM)")
+                    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    cursor.execute("VACUUM")
+                else:
+                    logger.info("Database predates auto_vacuum; run 'python retention.py' once to reclaim space")
+            else:
+                # The cursor must be drained for every page to be freed
+                cursor.execute(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+                cursor.fetchall()
+            cursor.execute("PRAGMA optimize")
+            cursor.close()
+            raw.commit()
+        finally:
+            raw.close()
+    elif engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM (ANALYZE) messages"))
+            conn.execute(text("VACUUM (ANALYZE) conversations"))
+
+
+def run_retention(policy: RetentionPolicy) -> dict:
+    """Apply every enabled rule in batches, then vacuum. Returns purged counts per rule."""
+    purged = {}
+    db = SessionLocal()
+    try:
+        for name, stmt in policy.rules().items():
+            purged[name] = 0
+            while True:
+                ids = db.execute(stmt.limit(policy.batch_size)).scalars().all()
+                if not ids:
+                    break
+                purged[name] += purge_conversations(db, ids)
+                time.sleep(BATCH_PAUSE_SECONDS)
+    finally:
+        db.close()
+
+    if any(purged.values()):
+        vacuum()
+    return purged
+
+
+async def retention_loop(policy: RetentionPolicy):
+    """Background task: run retention every interval without blocking the event loop."""
+    while True:
+        try:
+            purged = await asyncio.to_thread(run_retention, policy)
+            if any(purged.values()):
+                logger.info("Retention purged conversations: %s", purged)
+        except Exception:
+            logger.exception("Retention run failed")
+        await asyncio.sleep(policy.interval_hours * 3600)
+
+
+if __name__ == "__main__":
+    from logging_config import setup_logging
+    setup_logging(fmt="text")
+    policy = RetentionPolicy.from_env()
+    if not policy.enabled:
+        print("No retention rules configured (set RETENTION_* env vars).")
+    else:
+        print(run_retention(policy))
+    vacuum(convert=True)  # offline, so an old database can take the one-off full VACUUM
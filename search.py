@@ -0,0 +1,214 @@
+"""
+Conversation Search - Full-text index over messages and titles
+SQLite uses FTS5 external-content tables kept in sync by triggers;
+Postgres uses GIN expression indexes over to_tsvector().
+"""
+
+import re
+import logging
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Markers wrapped around matched terms in snippets (rendered as bold markdown)
+HIGHLIGHT_START = "**"
+HIGHLIGHT_END = "**"
+SNIPPET_TOKENS = 16
+
+# Title hits are short, so boost them relative to message hits
+TITLE_WEIGHT = 2.0
+
+SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+        title, content='conversations', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO conversations_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+]
+
+POSTGRES_SCHEMA = [
+    """CREATE INDEX IF NOT EXISTS ix_messages_content_fts ON messages
+        USING GIN (to_tsvector('english', coalesce(content, '')))""",
+    """CREATE INDEX IF NOT EXISTS ix_conversations_title_fts ON conversations
+        USING GIN (to_tsvector('english', coalesce(title, '')))""",
+]
+
+SQLITE_SEARCH = """
+SELECT * FROM (
+    SELECT c.id AS conversation_id, c.title AS conversation_title,
+           m.id AS message_id, m.role AS role,
+           snippet(messages_fts, 0, :hl_start, :hl_end, '…', :tokens) AS snippet,
+           bm25(messages_fts) AS rank, m.created_at AS created_at
+    FROM messages_fts
+    JOIN messages m ON m.id = messages_fts.rowid
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE messages_fts MATCH :q AND c.user_id = :user_id
+    UNION ALL
+    SELECT c.id, c.title, NULL, NULL,
+           highlight(conversations_fts, 0, :hl_start, :hl_end),
+           bm25(conversations_fts) * :title_weight, c.updated_at
+    FROM conversations_fts
+    JOIN conversations c ON c.id = conversations_fts.rowid
+    WHERE conversations_fts MATCH :q AND c.user_id = :user_id
+)
+ORDER BY rank
+LIMIT :limit OFFSET :offset
+"""
+
+POSTGRES_SEARCH = """
+WITH query AS (SELECT websearch_to_tsquery('english', :q) AS tsq)
+SELECT * FROM (
+    SELECT c.id AS conversation_id, c.title AS conversation_title,
+           m.id AS message_id, m.role AS role,
+           ts_headline('english', m.content, query.tsq, :headline_opts) AS snippet,
+           ts_rank(to_tsvector('english', coalesce(m.content, '')), query.tsq) AS rank,
+           m.created_at AS created_at
+    FROM messages m
+    JOIN conversations c ON c.id = m.conversation_id, query
+    WHERE to_tsvector('english', coalesce(m.content, '')) @@ query.tsq
+      AND c.user_id = :user_id
+    UNION ALL
+    SELECT c.id, c.title, NULL, NULL,
+           ts_headline('english', c.title, query.tsq, :headline_opts),
+           ts_rank(to_tsvector('english', coalesce(c.title, '')), query.tsq) * :title_weight,
+           c.updated_at
+    FROM conversations c, query
+    WHERE to_tsvector('english', coalesce(c.title, '')) @@ query.tsq
+      AND c.user_id = :user_id
+) hits
+ORDER BY rank DESC
+LIMIT :limit OFFSET :offset
+"""
+
+# Fallback for databases without a full-text engine (e.g. SQLite built without FTS5)
+LIKE_SEARCH = """
+SELECT * FROM (
+    SELECT c.id AS conversation_id, c.title AS conversation_title,
+           m.id AS message_id, m.role AS role, substr(m.content, 1, 200) AS snippet,
+           0 AS rank, m.created_at AS created_at
+    FROM messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE m.content LIKE :pattern ESCAPE '\\' AND c.user_id = :user_id
+    UNION ALL
+    SELECT c.id, c.title, NULL, NULL, c.title, 0, c.updated_at
+    FROM conversations c
+    WHERE c.title LIKE :pattern ESCAPE '\\' AND c.user_id = :user_id
+) hits
+ORDER BY created_at DESC
+LIMIT :limit OFFSET :offset
+"""
+
+# Set by init_search_index(): "fts5", "postgres" or "like"
+_backend = "like"
+
+
+def init_search_index(engine: Engine):
+    """Create the full-text index for the current dialect (idempotent)."""
+    global _backend
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for stmt in POSTGRES_SCHEMA:
+                conn.execute(text(stmt))
+        _backend = "postgres"
+        return
+
+    if engine.dialect.name != "sqlite":
+        _backend = "like"
+        return
+
+    try:
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            )).first()
+            for stmt in SQLITE_SCHEMA:
+                conn.execute(text(stmt))
+            if not exists:
+                # Backfill rows written before the index existed
+                conn.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+                conn.execute(text("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')"))
+        _backend = "fts5"
+    except OperationalError as e:
+        logger.warning("SQLite FTS5 unavailable, falling back to LIKE search: %s", e)
+        _backend = "like"
+
+
+def build_fts5_query(q: str) -> str:
+    """
+    Turn free text into a safe FTS5 query.
+    Every term is quoted (so operators/punctuation can't cause syntax errors)
+    and ANDed; the last term is a prefix match for search-as-you-type.
+    """
+    terms = re.findall(r"\w+", q)
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_conversations(
+    db: Session,
+    user_id: int,
+    q: str,
+    limit: int = 20,
+    offset: int = 0
+) -> list[dict]:
+    """Return ranked hits (message or title matches) for a user's conversations."""
+    params = {"user_id": user_id, "limit": limit, "offset": offset}
+
+    if _backend == "fts5":
+        match = build_fts5_query(q)
+        if not match:
+            return []
+        sql = SQLITE_SEARCH
+        params.update(
+            q=match,
+            hl_start=HIGHLIGHT_START,
+            hl_end=HIGHLIGHT_END,
+            tokens=SNIPPET_TOKENS,
+            title_weight=TITLE_WEIGHT,
+        )
+    elif _backend == "postgres":
+        sql = POSTGRES_SEARCH
+        params.update(
+            q=q,
+            headline_opts=(
+                f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, "
+                f"MaxWords={SNIPPET_TOKENS * 2}, MinWords={SNIPPET_TOKENS // 2}"
+            ),
+            title_weight=TITLE_WEIGHT,
+        )
+    else:
+        sql = LIKE_SEARCH
+        # Match % and _ literally ("x_1", "50%")
+        escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params.update(pattern=f"%{escaped}%")
+
+    rows = db.execute(text(sql), params).mappings().all()
+    return [dict(row) for row in rows]
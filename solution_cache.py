@@ -0,0 +1,99 @@
+"""
+Solution Cache - reuse answers and graphs for problems already solved
+Keyed by the normalized problem text plus the model and prompts that produced
+the answer, so changing either starts a fresh cache. Filled by live chats and
+ahead of time by warm_cache.py; shared by every worker through the database.
+"""
+
+import re
+import hashlib
+import unicodedata
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, SolutionCacheEntry
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_problem(problem: str) -> str:
+    """Case, spacing and trailing punctuation don't change the question."""
+    text = unicodedata.normalize("NFKC", problem).lower()
+    return _WHITESPACE.sub(" ", text).strip().rstrip(".?! ")
+
+
+class SolutionCache:
+    """Database-backed lookups; `version` identifies the model and prompts in use."""
+
+    def __init__(self, version: str):
+        self.version = version
+
+    def key(self, problem: str) -> str:
+        return hashlib.sha256(f"{self.version}|{normalize_problem(problem)}".encode()).hexdigest()
+
+    def get(self, problem: str) -> Optional[SolutionCacheEntry]:
+        db = SessionLocal()
+        try:
+            entry = db.execute(
+                select(SolutionCacheEntry).where(SolutionCacheEntry.key == self.key(problem))
+            ).scalar_one_or_none()
+            if entry:
+                db.expunge(entry)
+            return entry
+        finally:
+            db.close()
+
+    def get_solution(self, problem: str) -> Optional[str]:
+        entry = self.get(problem)
+        if not entry or not entry.solution:
+            return None
+        self._count_hit(entry.key)
+        return entry.solution
+
+    def get_graph(self, problem: str) -> Optional[str]:
+        entry = self.get(problem)
+        return entry.graph_path if entry else None
+
+    def store_solution(self, problem: str, solution: str):
+        self._upsert(problem, solution=solution)
+
+    def store_graph(self, problem: str, graph_path: str):
+        self._upsert(problem, graph_path=graph_path)
+
+    def _count_hit(self, key: str):
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(SolutionCacheEntry)
+                .where(SolutionCacheEntry.key == key)
+                .values(hits=SolutionCacheEntry.hits + 1)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _upsert(self, problem: str, **values):
+        key = self.key(problem)
+        db = SessionLocal()
+        try:
+            updated = db.execute(
+                update(SolutionCacheEntry)
+                .where(SolutionCacheEntry.key == key)
+                .values(**values, updated_at=datetime.utcnow())
+            ).rowcount
+            if not updated:
+                db.add(SolutionCacheEntry(key=key, problem=problem, **values))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker inserted it first; apply ours on top
+                db.rollback()
+                db.execute(
+                    update(SolutionCacheEntry)
+                    .where(SolutionCacheEntry.key == key)
+                    .values(**values, updated_at=datetime.utcnow())
+                )
+                db.commit()
+        finally:
+            db.close()
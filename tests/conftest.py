@@ -0,0 +1,19 @@
+"""
+Test setup - the app reads its configuration at import time, so point it at
+a throwaway SQLite database and graph directory before anything imports it.
+"""
+
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="math-agent-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["GRAPH_STORAGE"] = "filesystem"
+os.environ["GRAPH_STORAGE_DIR"] = os.path.join(_tmp, "graphs")
+os.environ["SOLUTION_CACHE"] = "false"
+os.environ["LOG_FORMAT"] = "text"
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,109 @@
+"""
+Lazy loading guards - Message.content is deferred with raiseload and
+Conversation.messages is raise_on_sql, so a code path that would load every
+message body raises InvalidRequestError instead of silently slowing down.
+These tests drive the routes that touch messages end to end on SQLite.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import InvalidRequestError
+
+import app as appmod
+from auth import create_jwt_token
+from database import SessionLocal, User
+
+SOLUTION = "The roots are $x = \\pm 1$, so the parabola crosses the x-axis twice."
+GRAPH_CODE = """```python
+import numpy as np
+import matplotlib.pyplot as plt
+x = np.linspace(-3, 3, 50)
+plt.plot(x, x**2 - 1)
+plt.title("y = x^2 - 1")
+```"""
+
+
+@pytest.fixture(scope="module")
+def client():
+    appmod.init_db()
+    with TestClient(appmod.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="module")
+def auth_headers():
+    db = SessionLocal()
+    try:
+        user = User(email="student@example.com", name="Student", provider="google", provider_id="lazy-1")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return {"Authorization": f"Bearer {create_jwt_token(user.id, user.email)}"}
+    finally:
+        db.close()
+
+
+@pytest.fixture(autouse=True)
+def stub_llm(monkeypatch):
+    solver = appmod.chat_engine.solver
+    monkeypatch.setattr(solver, "solve", lambda problem, on_token=None: SOLUTION)
+    monkeypatch.setattr(solver, "generate_graph_code", lambda problem, sweep=False: GRAPH_CODE)
+
+
+def request(client, method, url, **kwargs):
+    """Issue a request, failing the test (not erroring) if a raiseload guard fires."""
+    try:
+        return client.request(method, url, **kwargs)
+    except InvalidRequestError as e:
+        pytest.fail(f"{method} {url} loaded lazily: {e}")
+
+
+def test_chat_turn_with_graph_confirmation(client, auth_headers):
+    response = request(client, "POST", "/chat", json={"content": "Solve x^2 - 1 = 0"}, headers=auth_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["should_offer_graph"] is True
+    conversation_id = body["conversation_id"]
+
+    response = request(
+        client, "POST", "/chat",
+        json={"content": "yes", "conversation_id": conversation_id},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    message = response.json()["message"]
+    assert message["has_graph"] is True
+    assert message["graph_path"].startswith("/graph/")
+
+    response = request(client, "GET", message["graph_path"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+
+    response = request(
+        client, "GET", f"/chat/{conversation_id}/messages/{message['id']}/graph", headers=auth_headers
+    )
+    assert response.json()["status"] == "ready"
+
+
+def test_history_and_conversation_routes(client, auth_headers):
+    response = request(client, "POST", "/chat", json={"content": "Solve x^2 - 1 = 0"}, headers=auth_headers)
+    conversation_id = response.json()["conversation_id"]
+
+    response = request(client, "GET", "/chat/history", headers=auth_headers)
+    assert response.status_code == 200
+    assert any(item["id"] == conversation_id for item in response.json())
+
+    response = request(client, "GET", f"/chat/{conversation_id}", headers=auth_headers)
+    assert response.status_code == 200
+    contents = [m["content"] for m in response.json()["messages"]]
+    assert contents[0] == "Solve x^2 - 1 = 0"
+    assert contents[1].startswith(SOLUTION)
+
+
+def test_graph_for_conversation(client, auth_headers):
+    response = request(client, "POST", "/chat", json={"content": "Solve x^2 - 1 = 0"}, headers=auth_headers)
+    conversation_id = response.json()["conversation_id"]
+
+    response = request(client, "POST", f"/chat/{conversation_id}/graph", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["graph_base64"]
@@ -0,0 +1,134 @@
+"""
+Usage Accounting - LLM token and latency records per chat turn
+MathSolver reports every upstream call to the tracker active in the current
+context; the chat route persists them next to the assistant message.
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select, func, case
+from sqlalchemy.orm import Session
+from database import LLMUsage, User
+
+_current_tracker: ContextVar = ContextVar("usage_tracker", default=None)
+
+
+class UsageTracker:
+    """Collects LLM call records for one unit of work (usually a chat turn)."""
+
+    def __init__(self):
+        self.records: list[dict] = []
+
+    def extend(self, records: list[dict], **overrides):
+        self.records.extend({**r, **overrides} for r in records)
+
+
+@contextmanager
+def track_usage():
+    """Collect records from MathSolver calls made inside the block (same thread/context)."""
+    tracker = UsageTracker()
+    token = _current_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _current_tracker.reset(token)
+
+
+def current_tracker() -> Optional[UsageTracker]:
+    return _current_tracker.get()
+
+
+def _usage_field(usage, name: str) -> int:
+    if usage is None:
+        return 0
+    if isinstance(usage, dict):
+        return usage.get(name) or 0
+    return getattr(usage, name, 0) or 0
+
+
+def record_llm_call(kind: str, model: str, usage, started: float, cache_hit: bool = False):
+    """
+    Record one completed call; `started` is a time.perf_counter() value.
+    Answers served from one of our caches are recorded with cache_hit and no usage.
+    """
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return
+
+    details = getattr(usage, "prompt_tokens_details", None) if usage is not None else None
+    tracker.records.append({
+        "kind": kind,
+        "model": model,
+        "prompt_tokens": _usage_field(usage, "prompt_tokens"),
+        "completion_tokens": _usage_field(usage, "completion_tokens"),
+        "cached_tokens": _usage_field(details, "cached_tokens"),
+        "latency_ms": int((time.perf_counter() - started) * 1000),
+        "cache_hit": cache_hit,
+    })
+
+
+def save_usage(
+    db: Session,
+    records: list[dict],
+    user_id: int,
+    conversation_id: Optional[int] = None,
+    message_id: Optional[int] = None
+):
+    """Add usage rows to the session (committed with the caller's transaction)."""
+    db.add_all(
+        LLMUsage(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            message_id=message_id,
+            **record
+        )
+        for record in records
+    )
+
+
+def usage_report(
+    db: Session,
+    group_by: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> list[dict]:
+    """Aggregate usage by 'user', 'day' or 'model' over [since, until)."""
+    if group_by == "user":
+        key = func.coalesce(User.email, "unknown")
+    elif group_by == "day":
+        key = func.date(LLMUsage.created_at)
+    elif group_by == "model":
+        key = LLMUsage.model
+    else:
+        raise ValueError(f"Unknown group_by: {group_by}")
+
+    stmt = select(
+        key.label("key"),
+        func.count(LLMUsage.id).label("calls"),
+        func.coalesce(func.sum(LLMUsage.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(LLMUsage.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(LLMUsage.cached_tokens), 0).label("cached_tokens"),
+        func.avg(LLMUsage.latency_ms).label("avg_latency_ms"),
+        func.max(LLMUsage.latency_ms).label("max_latency_ms"),
+        func.sum(case((LLMUsage.cache_hit, 1), else_=0)).label("cache_hits"),
+    ).select_from(LLMUsage)
+    if group_by == "user":
+        stmt = stmt.outerjoin(User, User.id == LLMUsage.user_id)
+    if since:
+        stmt = stmt.where(LLMUsage.created_at >= since)
+    if until:
+        stmt = stmt.where(LLMUsage.created_at < until)
+
+    rows = db.execute(stmt.group_by(key).order_by(key)).mappings().all()
+    return [
+        {
+            **row,
+            "key": str(row["key"]),
+            "total_tokens": row["prompt_tokens"] + row["completion_tokens"],
+            "avg_latency_ms": round(row["avg_latency_ms"] or 0),
+        }
+        for row in rows
+    ]
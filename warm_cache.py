@@ -0,0 +1,146 @@
+"""
+Cache Warming - solve a known problem corpus before students ask
+Reads JSONL, one problem per line:
+    {"id": "jee-2023-p1-q4", "problem": "...", "graph": true}
+("id" and "graph" are optional; "graph" overrides graph detection) and runs
+each problem through ChatEngine, pre-rendering a graph wherever a chat
+would draw or offer one. Results land in the solution cache live chats read.
+Resumable: cached problems are skipped, so an interrupted run is just rerun.
+
+Run with: python warm_cache.py corpus.jsonl [--concurrency 4] [--no-graphs] [--limit N]
+"""
+
+from dotenv import load_dotenv
+load_dotenv()  # DATABASE_URL must be set before database is imported
+
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, Optional
+from database import SessionLocal, init_db
+from chat_engine import ChatEngine
+from usage import track_usage, save_usage
+from logging_config import setup_logging
+
+DEFAULT_CONCURRENCY = 4
+PROGRESS_EVERY = 25
+
+
+def read_corpus(path: str, limit: Optional[int] = None) -> Iterator[tuple[str, dict]]:
+    """Yield (label, record) for each valid line; bad lines are reported and skipped."""
+    count = 0
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if limit is not None and count >= limit:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"Line {line_no}: invalid JSON, skipped")
+                continue
+            problem = record.get("problem") if isinstance(record, dict) else None
+            if not isinstance(problem, str) or not problem.strip():
+                print(f"Line {line_no}: missing 'problem', skipped")
+                continue
+            count += 1
+            yield str(record.get("id") or f"Line {line_no}"), record
+
+
+def wants_graph(engine: ChatEngine, record: dict, solution: str) -> bool:
+    """Same rule as a live chat: an explicit request, or a graph the answer would offer."""
+    if isinstance(record.get("graph"), bool):
+        return record["graph"]
+    problem = record["problem"]
+    return engine.solver.needs_graph(problem) or engine.should_offer_graph(problem, solution)
+
+
+def warm_problem(engine: ChatEngine, record: dict, graphs: bool) -> str:
+    """Solve (and graph) one problem. Returns cached, warmed, graph_failed or failed."""
+    problem = record["problem"]
+    entry = engine.cache.get(problem)
+    solution = entry.solution if entry else None
+    if solution and (not graphs or entry.graph_path or not wants_graph(engine, record, solution)):
+        return "cached"
+
+    status = "warmed"
+    with track_usage() as usage:
+        if not solution:
+            solution = engine.solve(problem)
+            if solution.startswith("Error:"):
+                status = "failed"
+        if status != "failed" and graphs and wants_graph(engine, record, solution):
+            if not engine.generate_graph(problem):
+                status = "graph_failed"
+
+    # Billed to no user, so warming cost shows up separately in /admin/usage
+    db = SessionLocal()
+    try:
+        save_usage(db, usage.records, None)
+        db.commit()
+    finally:
+        db.close()
+    return status
+
+
+def warm_corpus(
+    path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    graphs: bool = True,
+    limit: Optional[int] = None
+) -> Counter:
+    """Warm every problem with at most `concurrency` in flight. Returns counts per status."""
+    engine = ChatEngine(solution_cache=True)
+    counts = Counter()
+    started = time.monotonic()
+
+    def collect(futures):
+        for future in futures:
+            label = future_labels.pop(future)
+            try:
+                status = future.result()
+            except Exception as e:
+                print(f"{label}: {e}")
+                status = "failed"
+            counts[status] += 1
+            if status in ("failed", "graph_failed"):
+                print(f"{label}: {status}")
+            done = sum(counts.values())
+            if done % PROGRESS_EVERY == 0:
+                print(f"{done} done in {time.monotonic() - started:.0f}s: {dict(counts)}")
+
+    future_labels = {}
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warm")
+    try:
+        for label, record in read_corpus(path, limit):
+            # Read ahead only a little so huge corpora never sit in memory
+            if len(future_labels) >= concurrency * 2:
+                finished, _ = wait(future_labels, return_when=FIRST_COMPLETED)
+                collect(finished)
+            future_labels[pool.submit(warm_problem, engine, record, graphs)] = label
+        collect(list(future_labels))
+    except KeyboardInterrupt:
+        print("Interrupted; finished problems are cached, rerun to continue.")
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-solve a JSONL problem corpus into the solution cache.")
+    parser.add_argument("corpus", help="JSONL file with a 'problem' field per line")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="problems in flight at once")
+    parser.add_argument("--no-graphs", action="store_true", help="solve only, skip graph pre-rendering")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many problems")
+    args = parser.parse_args()
+
+    setup_logging(fmt="text")
+    init_db()
+    counts = warm_corpus(args.corpus, max(1, args.concurrency), graphs=not args.no_graphs, limit=args.limit)
+    print(f"Done: {dict(counts)}")
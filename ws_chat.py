@@ -0,0 +1,259 @@
+"""
+WebSocket Chat - persistent authenticated chat sessions
+The client authenticates once, then sends turns over the same connection.
+
+Client -> server (JSON):
+    {"type": "auth", "token": "<jwt>"}                      first frame (or ?token= in the URL)
+    {"type": "message", "content": "...", "conversation_id": 1, "request_id": "abc"}
+    {"type": "open", "conversation_id": 1}                  make it the session's conversation
+    {"type": "new"}                                         next message starts a new conversation
+    {"type": "history"}
+    {"type": "ping"} / {"type": "pong"}
+
+Server -> client:
+    ready, token (streamed solution deltas, best-effort), message (final ChatResponse),
+    graph_ready, history, opened, ping/pong, error
+A message sent with graph_pending gets its graph_ready later on the same
+connection (graph_path null if the graph failed), while the socket is open.
+"""
+
+import json
+import logging
+import time
+import asyncio
+import functools
+import concurrent.futures
+from typing import Callable, Optional
+from fastapi import WebSocket, WebSocketDisconnect, HTTPException
+from database import SessionLocal, Conversation
+from auth import get_user_from_token
+from models import UserResponse
+from responses import fast_dumps
+
+logger = logging.getLogger(__name__)
+
+AUTH_TIMEOUT = 10
+HEARTBEAT_INTERVAL = 20
+IDLE_TIMEOUT = 60
+OUTBOX_SIZE = 64  # queued outgoing frames before producers wait
+MAX_PENDING_TURNS = 4
+TOKEN_SEND_TIMEOUT = 2  # a stalled client drops token deltas, never the final message
+
+# Application close codes (4000-4999 are free for app use)
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_IDLE = 4408
+
+
+class ChatSocketSession:
+    """State and tasks for one /ws/chat connection."""
+
+    def __init__(self, websocket: WebSocket, run_turn: Callable, list_history: Callable):
+        self.ws = websocket
+        self.run_turn = run_turn  # (db, user_id, content, conversation_id, on_token, on_graph=) -> ChatResponse
+        self.list_history = list_history  # (db, user_id) -> list[dict]
+        self.user_id: Optional[int] = None
+        self.conversation_id: Optional[int] = None
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        self.turns: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_TURNS)
+        self.last_seen = time.monotonic()
+        self.closed = False
+
+    async def serve(self):
+        await self.ws.accept()
+        user = await self._authenticate()
+        if not user:
+            return
+
+        self.user_id = user.id
+        await self.send({
+            "type": "ready",
+            "user": UserResponse.model_validate(user).model_dump(mode="json")
+        })
+
+        tasks = [
+            asyncio.create_task(self._sender()),
+            asyncio.create_task(self._heartbeat()),
+            asyncio.create_task(self._turn_worker()),
+        ]
+        try:
+            await self._receiver()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            for task in tasks:
+                task.cancel()
+
+    # ---------- Helpers ----------
+
+    def _with_db(self, fn, *args):
+        """Run fn(db, *args) with a short-lived session (called in a worker thread)."""
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def send(self, event: dict):
+        """Queue a frame; waits when the client is slow to read (backpressure)."""
+        await self.outbox.put(event)
+
+    async def send_error(self, detail: str, request_id=None):
+        await self.send({"type": "error", "detail": detail, "request_id": request_id})
+
+    async def _authenticate(self):
+        token = self.ws.query_params.get("token")
+        try:
+            if not token:
+                frame = json.loads(await asyncio.wait_for(self.ws.receive_text(), AUTH_TIMEOUT))
+                if frame.get("type") != "auth":
+                    raise ValueError("expected auth frame")
+                token = frame.get("token")
+            return await asyncio.to_thread(self._with_db, get_user_from_token, token)
+        except WebSocketDisconnect:
+            return None
+        except (asyncio.TimeoutError, ValueError, AttributeError, TypeError, HTTPException):
+            await self.ws.send_json({"type": "error", "detail": "Not authenticated"})
+            await self.ws.close(code=CLOSE_UNAUTHORIZED)
+            return None
+
+    # ---------- Tasks ----------
+
+    async def _sender(self):
+        while True:
+            event = await self.outbox.get()
+            await self.ws.send_text(fast_dumps(event).decode("utf-8"))
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.monotonic() - self.last_seen > IDLE_TIMEOUT:
+                self.closed = True
+                await self.ws.close(code=CLOSE_IDLE)
+                return
+            await self.send({"type": "ping"})
+
+    async def _receiver(self):
+        while True:
+            raw = await self.ws.receive_text()
+            self.last_seen = time.monotonic()
+            try:
+                frame = json.loads(raw)
+                kind = frame.get("type")
+            except (ValueError, AttributeError):
+                await self.send_error("Invalid frame")
+                continue
+
+            if kind == "ping":
+                await self.send({"type": "pong"})
+            elif kind == "pong":
+                pass
+            elif kind == "message":
+                await self._enqueue_turn(frame)
+            elif kind == "open":
+                await self._open_conversation(frame.get("conversation_id"))
+            elif kind == "new":
+                self.conversation_id = None
+            elif kind == "history":
+                await self._send_history()
+            else:
+                await self.send_error(f"Unknown frame type: {kind}")
+
+    async def _enqueue_turn(self, frame: dict):
+        content = frame.get("content")
+        request_id = frame.get("request_id")
+        if not isinstance(content, str) or not content.strip():
+            await self.send_error("Message content is required", request_id)
+            return
+        try:
+            self.turns.put_nowait(frame)
+        except asyncio.QueueFull:
+            await self.send_error("Too many pending messages", request_id)
+
+    async def _open_conversation(self, conversation_id):
+        def owns(db, conversation_id):
+            return db.query(Conversation.id).filter(
+                Conversation.id == conversation_id,
+                Conversation.user_id == self.user_id
+            ).first() is not None
+
+        if not isinstance(conversation_id, int) or not await asyncio.to_thread(
+            self._with_db, owns, conversation_id
+        ):
+            await self.send_error("Conversation not found")
+            return
+        self.conversation_id = conversation_id
+        await self.send({"type": "opened", "conversation_id": conversation_id})
+
+    async def _send_history(self):
+        items = await asyncio.to_thread(self._with_db, self.list_history, self.user_id)
+        await self.send({
+            "type": "history",
+            "conversations": items
+        })
+
+    async def _turn_worker(self):
+        """Run queued turns one at a time so messages in a conversation stay ordered."""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            frame = await self.turns.get()
+            request_id = frame.get("request_id")
+            conversation_id = frame.get("conversation_id") or self.conversation_id
+
+            def on_token(delta: str):
+                # Called from the worker thread; blocking here throttles the LLM stream
+                if self.closed:
+                    return
+                future = asyncio.run_coroutine_threadsafe(
+                    self.send({"type": "token", "request_id": request_id, "delta": delta}),
+                    loop
+                )
+                try:
+                    future.result(timeout=TOKEN_SEND_TIMEOUT)
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+
+            def on_graph(conversation_id: int, message_id: int, graph_path: Optional[str], graph_base64: Optional[str]):
+                # A pending graph finished (on the graph pool, maybe long after the turn)
+                if self.closed:
+                    return
+                asyncio.run_coroutine_threadsafe(self.send({
+                    "type": "graph_ready",
+                    "request_id": request_id,
+                    "conversation_id": conversation_id,
+                    "message_id": message_id,
+                    "graph_path": graph_path,
+                    "graph_base64": graph_base64
+                }), loop)
+
+            try:
+                response = await asyncio.to_thread(
+                    self._with_db, functools.partial(self.run_turn, on_graph=on_graph),
+                    self.user_id, frame["content"], conversation_id, on_token
+                )
+            except HTTPException as e:
+                await self.send_error(e.detail, request_id)
+                continue
+            except Exception:
+                logger.exception("WebSocket chat turn failed")
+                await self.send_error("Failed to process message", request_id)
+                continue
+
+            created = response.conversation_id != conversation_id
+            self.conversation_id = response.conversation_id
+            # graph_base64 travels only in graph_ready to avoid sending it twice
+            payload = response.model_dump(mode="json", exclude={"graph_base64"})
+
+            await self.send({"type": "message", "request_id": request_id, **payload})
+            if response.message.has_graph:
+                await self.send({
+                    "type": "graph_ready",
+                    "request_id": request_id,
+                    "conversation_id": response.conversation_id,
+                    "message_id": response.message.id,
+                    "graph_path": response.message.graph_path,
+                    "graph_base64": response.graph_base64
+                })
+            if created:
+                await self._send_history()